@@ -1,19 +1,25 @@
+import time
+STARTUP_T0 = time.perf_counter()
 import sys
 import os
 import uuid
-import time
-import pyperclip
 import threading
 import subprocess
 import platform
+
+import onyx_backend as core
+
+# Install the import tracer before Qt so its import cost shows up in the report
+STARTUP_TRACE = core.StartupTrace(STARTUP_T0) if "--trace-startup" in sys.argv or os.environ.get("ONYX_STARTUP_TRACE") == "1" else None
+if STARTUP_TRACE: STARTUP_TRACE.mark("backend_imported"); STARTUP_TRACE.install()
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QTabWidget, QPushButton, QLineEdit, QLabel, QComboBox, 
-                             QCheckBox, QGroupBox, QScrollArea, QFrame, QProgressBar, QFileDialog, QMessageBox, QDialog)
-from PyQt6.QtCore import Qt, pyqtSignal, QObject, QThread, QSize
+                             QCheckBox, QGroupBox, QScrollArea, QFrame, QProgressBar, QFileDialog, QMessageBox, QDialog,
+                             QTableView, QAbstractItemView, QHeaderView, QPlainTextEdit)
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QThread, QSize, QAbstractTableModel, QModelIndex, QTimer
 from PyQt6.QtGui import QIcon, QFont
 
-import onyx_backend as core
-
 # ================= STYLE =================
 STYLESHEET = """
 QMainWindow, QWidget { background-color: #121212; color: #E0E0E0; font-family: 'Segoe UI', Arial; font-size: 14px; }
@@ -24,26 +30,91 @@ QPushButton { background-color: #333333; border: 1px solid #555555; color: #FFFF
 QPushButton:hover { background-color: #444444; border-color: #0078D7; }
 QPushButton:pressed { background-color: #222222; }
 QLineEdit, QComboBox, QTextEdit { background-color: #1E1E1E; border: 1px solid #333333; color: #FFFFFF; padding: 4px; }
-QTableWidget { background-color: #1E1E1E; gridline-color: #333333; color: #FFFFFF; selection-background-color: #0078D7; }
+QTableWidget, QTableView { background-color: #1E1E1E; gridline-color: #333333; color: #FFFFFF; selection-background-color: #0078D7; }
+QHeaderView::section { background-color: #1E1E1E; color: #AAAAAA; border: none; border-bottom: 1px solid #333333; padding: 4px; }
 QProgressBar { border: 1px solid #333333; text-align: center; }
 QProgressBar::chunk { background-color: #0078D7; }
 QGroupBox { border: 1px solid #333333; margin-top: 20px; font-weight: bold; }
 QGroupBox::title { subcontrol-origin: margin; left: 10px; padding: 0 3px; color: #0078D7; }
 """
 
+DEDUP_POLICIES = {"Skip": "skip", "Re-link to History": "relink", "Download Again": "force"}
+
 # ================= WORKER SIGNALS =================
 class WorkerSignals(QObject):
-    progress = pyqtSignal(str, int, str)
     finished = pyqtSignal(str, dict, bool)
     log = pyqtSignal(str, str)
+    state = pyqtSignal(str, str)
+    entry = pyqtSignal(str, str, str)
     update_result = pyqtSignal(bool, str)
     app_update_found = pyqtSignal(str, str)
+    app_update_progress = pyqtSignal(int)
+    app_update_done = pyqtSignal(bool, str)
+    history_ready = pyqtSignal(object)
+    thumb_item = pyqtSignal(dict)
+    thumb_done = pyqtSignal(int)
     
     # Dependencies
     dep_progress = pyqtSignal(int)
     dep_status = pyqtSignal(str)
     dep_finished = pyqtSignal(bool, str)
 
+# ================= HISTORY MODEL =================
+class HistoryModel(QAbstractTableModel):
+    HEADERS = ("Title", "Platform", "Size", "Date")
+    KEYS = ("title", "platform", "size", "date")
+    PAGE_SIZE = 100
+
+    def __init__(self, history):
+        super().__init__()
+        self.history = history; self.rows = []; self.search = ""; self.platform = ""
+        self.total = history.count()
+
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.rows)
+    def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return row.get(self.KEYS[index.column()], "")
+        if role == Qt.ItemDataRole.ToolTipRole: return row.get('path', "")
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal: return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()): return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        batch = self.history.page(len(self.rows), self.PAGE_SIZE, self.search, self.platform)
+        if not batch: self.total = len(self.rows); return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(batch) - 1)
+        self.rows.extend(batch)
+        self.endInsertRows()
+
+    def set_filter(self, search="", platform=""):
+        self.beginResetModel()
+        self.search = search; self.platform = platform; self.rows = []
+        self.total = self.history.count(search, platform)
+        self.endResetModel()
+
+    def matches(self, entry):
+        return self.search.lower() in entry.get('title', "").lower() and (not self.platform or entry.get('platform') == self.platform)
+
+    def prepend(self, entry):
+        if not self.matches(entry): return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.rows.insert(0, entry); self.total += 1
+        self.endInsertRows()
+
+    def remove(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]; self.total -= 1
+        self.endRemoveRows()
+
+    def entry(self, row): return self.rows[row] if 0 <= row < len(self.rows) else None
+
 # ================= MAIN APP =================
 class OnyxApp(QMainWindow):
     def __init__(self):
@@ -53,16 +124,27 @@ class OnyxApp(QMainWindow):
         if os.path.exists("icon.ico"): self.setWindowIcon(QIcon("icon.ico"))
         
         self.settings = core.SettingsManager()
-        self.history = core.HistoryManager()
+        self.history = None; self.history_model = None; self.pending_history = []; self.held_jobs = []
         self.updater = core.SelfUpdater()
         self.dep_manager = core.DependencyManager()
+        self.services = core.Services(self.settings); sv = self.services
+        self.scheduler, self.metadata_cache, self.progress, self.pp_pool, self.rates = sv.scheduler, sv.cache, sv.progress, sv.pp_pool, sv.rates
+        self.metrics, self.tuner, self.disk, self.outputs, self.journal, self.retry = sv.metrics, sv.tuner, sv.disk, sv.outputs, sv.journal, sv.retry
         self.active_tasks = {}
-        self.clipboard_monitor_active = True
+        self.clip_last = ""; self.thumb_job = None; self.thumb_counts = [0, 0]
         
         self.signals = WorkerSignals()
         self.connect_signals()
 
         self.setup_ui()
+
+        # Open (and if needed migrate) the history store off the GUI thread
+        threading.Thread(target=lambda: self.signals.history_ready.emit(core.HistoryManager()), daemon=True).start()
+        # Pick up jobs that were queued or mid-download when the app last closed
+        QTimer.singleShot(0, self.restore_jobs)
+
+        # UI pulls batched progress at 10 Hz instead of handling every hook callback
+        self.progress_timer = QTimer(self); self.progress_timer.setInterval(100); self.progress_timer.timeout.connect(self.on_progress_tick)
         
         # CHECK DEPENDENCIES ON STARTUP
         if not self.dep_manager.is_ffmpeg_installed():
@@ -71,14 +153,20 @@ class OnyxApp(QMainWindow):
             self.start_clipboard_monitor()
 
     def connect_signals(self):
-        self.signals.progress.connect(self.on_task_progress)
         self.signals.finished.connect(self.on_task_finished)
         self.signals.log.connect(self.on_task_log)
+        self.signals.state.connect(self.on_task_state)
+        self.signals.entry.connect(self.on_playlist_entry)
         self.signals.update_result.connect(self.on_update_result)
         self.signals.app_update_found.connect(self.on_app_update_found)
+        self.signals.app_update_progress.connect(self.update_dl_progress)
+        self.signals.app_update_done.connect(self.on_app_update_done)
         self.signals.dep_progress.connect(self.on_dep_progress)
         self.signals.dep_status.connect(self.on_dep_status)
         self.signals.dep_finished.connect(self.on_dep_finished)
+        self.signals.history_ready.connect(self.on_history_ready)
+        self.signals.thumb_item.connect(self.on_thumb_item)
+        self.signals.thumb_done.connect(self.on_thumb_done)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -87,12 +175,25 @@ class OnyxApp(QMainWindow):
         self.tabs = QTabWidget()
         main_layout.addWidget(self.tabs)
         
-        self.tab_dashboard = QWidget(); self.setup_dashboard(self.tab_dashboard); self.tabs.addTab(self.tab_dashboard, "Dashboard")
-        self.tab_tasks = QWidget(); self.setup_tasks(self.tab_tasks); self.tabs.addTab(self.tab_tasks, "Tasks")
-        self.tab_yt = QWidget(); self.setup_youtube(self.tab_yt); self.tabs.addTab(self.tab_yt, "YouTube Pro")
-        self.tab_thumb = QWidget(); self.setup_thumbnails(self.tab_thumb); self.tabs.addTab(self.tab_thumb, "Thumbnails")
-        self.tab_network = QWidget(); self.setup_network(self.tab_network); self.tabs.addTab(self.tab_network, "Settings")
-        self.tab_history = QWidget(); self.setup_history(self.tab_history); self.tabs.addTab(self.tab_history, "History")
+        # Tabs are empty shells until first shown; only the Dashboard is built before the window appears
+        self.tab_builders = {}
+        self.tab_dashboard = QWidget(); self.tab_builders[self.tab_dashboard] = self.setup_dashboard; self.tabs.addTab(self.tab_dashboard, "Dashboard")
+        self.tab_tasks = QWidget(); self.tab_builders[self.tab_tasks] = self.setup_tasks; self.tabs.addTab(self.tab_tasks, "Tasks")
+        self.tab_yt = QWidget(); self.tab_builders[self.tab_yt] = self.setup_youtube; self.tabs.addTab(self.tab_yt, "YouTube Pro")
+        self.tab_thumb = QWidget(); self.tab_builders[self.tab_thumb] = self.setup_thumbnails; self.tabs.addTab(self.tab_thumb, "Thumbnails")
+        self.tab_network = QWidget(); self.tab_builders[self.tab_network] = self.setup_network; self.tabs.addTab(self.tab_network, "Settings")
+        self.tab_history = QWidget(); self.tab_builders[self.tab_history] = self.setup_history; self.tabs.addTab(self.tab_history, "History")
+        self.tabs.currentChanged.connect(lambda i: self.ensure_tab(self.tabs.widget(i)))
+        self.ensure_tab(self.tab_dashboard)
+
+    def ensure_tab(self, tab):
+        builder = self.tab_builders.pop(tab, None)
+        if builder: builder(tab)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if STARTUP_TRACE and STARTUP_TRACE.original:
+            STARTUP_TRACE.mark("first_paint"); STARTUP_TRACE.uninstall(); STARTUP_TRACE.write()
 
     # ================= DEPENDENCY DIALOG (NEW) =================
     def show_dep_dialog(self):
@@ -146,7 +247,8 @@ class OnyxApp(QMainWindow):
         self.dash_input = QLineEdit(); self.dash_input.setPlaceholderText("Paste URL here..."); v.addWidget(self.dash_input)
         h = QHBoxLayout(); self.dash_fmt = QComboBox(); self.dash_fmt.addItems(["Video + Audio", "Audio Only"]); h.addWidget(self.dash_fmt)
         b = QPushButton("Start Download"); b.clicked.connect(lambda: self.start_download(self.dash_input, self.dash_fmt.currentText(), "Best")); h.addWidget(b)
-        v.addLayout(h); l.addWidget(g)
+        v.addLayout(h); self.dash_clip = QLabel(""); self.dash_clip.setStyleSheet("color:#888"); v.addWidget(self.dash_clip); l.addWidget(g)
+        self.dash_input.textChanged.connect(lambda t: None if t else self.dash_clip.setText(""))
 
     def setup_youtube(self, parent):
         l = QVBoxLayout(parent); l.setAlignment(Qt.AlignmentFlag.AlignTop)
@@ -162,58 +264,157 @@ class OnyxApp(QMainWindow):
         v.addWidget(QLabel("Download High-Res Cover (JPG)")); self.thumb_input = QLineEdit(); self.thumb_input.setPlaceholderText("Paste Link..."); v.addWidget(self.thumb_input)
         b = QPushButton("Get Thumbnail"); b.clicked.connect(lambda: self.start_download(self.thumb_input, "", "", False, False, mode='thumbnail')); v.addWidget(b); l.addWidget(g)
 
+        gb = QGroupBox("Batch Thumbnails"); vb = QVBoxLayout(gb)
+        self.thumb_batch = QPlainTextEdit(); self.thumb_batch.setPlaceholderText("Paste many links or a playlist/channel link, one per line..."); self.thumb_batch.setFixedHeight(120); vb.addWidget(self.thumb_batch)
+        hb = QHBoxLayout(); self.btn_thumb_batch = QPushButton("Get All Thumbnails"); self.btn_thumb_batch.clicked.connect(self.start_thumbnail_batch); hb.addWidget(self.btn_thumb_batch)
+        self.btn_thumb_cancel = QPushButton("Cancel"); self.btn_thumb_cancel.setStyleSheet("background-color: #8B0000; border: none;"); self.btn_thumb_cancel.setFixedWidth(80); self.btn_thumb_cancel.setEnabled(False); self.btn_thumb_cancel.clicked.connect(lambda: self.thumb_job.cancel() if self.thumb_job else None); hb.addWidget(self.btn_thumb_cancel); vb.addLayout(hb)
+        self.thumb_pb = QProgressBar(); self.thumb_pb.setValue(0); vb.addWidget(self.thumb_pb); self.lbl_thumb = QLabel(""); self.lbl_thumb.setStyleSheet("color:#888"); vb.addWidget(self.lbl_thumb); l.addWidget(gb)
+
     def setup_network(self, parent):
         l = QVBoxLayout(parent); l.setAlignment(Qt.AlignmentFlag.AlignTop)
         g = QGroupBox("Configuration"); v = QVBoxLayout(g)
         v.addWidget(QLabel("Proxy URL:")); self.net_proxy = QLineEdit(); self.net_proxy.setText(self.settings.get("proxy")); v.addWidget(self.net_proxy)
         v.addWidget(QLabel("Cookies File:")); h = QHBoxLayout(); self.net_cookie = QLineEdit(); self.net_cookie.setText(self.settings.get("cookies_path")); h.addWidget(self.net_cookie)
         bb = QPushButton("Browse"); bb.clicked.connect(self.browse_cookies); h.addWidget(bb); v.addLayout(h)
+        hp = QHBoxLayout(); hp.addWidget(QLabel("Parallel Downloads:")); self.net_parallel = QComboBox(); self.net_parallel.addItems([str(i) for i in range(1, 9)])
+        self.net_parallel.setCurrentText(str(self.settings.get("max_concurrent"))); hp.addWidget(self.net_parallel); v.addLayout(hp)
+        hd = QHBoxLayout(); hd.addWidget(QLabel("Already Downloaded:")); self.net_dedup = QComboBox(); self.net_dedup.addItems(list(DEDUP_POLICIES))
+        self.net_dedup.setCurrentIndex(list(DEDUP_POLICIES.values()).index(self.settings.get("dedup_policy")) if self.settings.get("dedup_policy") in DEDUP_POLICIES.values() else 0); hd.addWidget(self.net_dedup)
+        self.net_hash = QCheckBox("Hash Files"); self.net_hash.setChecked(self.settings.get("dedup_hash")); hd.addWidget(self.net_hash); v.addLayout(hd)
+        hl = QHBoxLayout(); hl.addWidget(QLabel("Bandwidth Limit (KB/s, 0 = unlimited):")); self.net_limit = QLineEdit(str(self.settings.get("rate_limit_kbps"))); self.net_limit.setFixedWidth(100); hl.addWidget(self.net_limit); v.addLayout(hl)
+        self.net_clip = QCheckBox("Download copied links automatically"); self.net_clip.setChecked(self.settings.get("clipboard_auto_enqueue")); v.addWidget(self.net_clip)
         bs = QPushButton("Save Settings"); bs.clicked.connect(self.save_settings); v.addWidget(bs); l.addWidget(g)
         
         gu = QGroupBox("Updates"); vu = QVBoxLayout(gu); hu = QHBoxLayout()
         self.btn_app_upd = QPushButton(f"Check for App Updates (v{core.VERSION})"); self.btn_app_upd.setStyleSheet("background-color: #004d40; border: 1px solid #00695c;")
         self.btn_app_upd.clicked.connect(self.check_app_updates); hu.addWidget(self.btn_app_upd); vu.addLayout(hu); l.addWidget(gu)
 
+        gc = QGroupBox("Metadata Cache"); hc = QHBoxLayout(gc); self.lbl_cache = QLabel(""); hc.addWidget(self.lbl_cache)
+        bc = QPushButton("Clear Cache"); bc.setFixedWidth(120); bc.clicked.connect(self.clear_metadata_cache); hc.addWidget(bc); l.addWidget(gc); self.update_cache_label()
+
+        gm = QGroupBox("Performance (this session)"); vm = QVBoxLayout(gm); self.lbl_metrics = QLabel(""); self.lbl_metrics.setStyleSheet("color:#888"); vm.addWidget(self.lbl_metrics); l.addWidget(gm); self.update_metrics_label()
+
     def setup_tasks(self, parent):
         l = QVBoxLayout(parent); h = QHBoxLayout()
-        h.addWidget(QLabel("Active Downloads")); b = QPushButton("Clear Finished"); b.clicked.connect(self.clear_finished_tasks); h.addWidget(b); l.addLayout(h)
+        h.addWidget(QLabel("Active Downloads")); self.lbl_queue = QLabel(""); self.lbl_queue.setStyleSheet("color:#888"); h.addWidget(self.lbl_queue); b = QPushButton("Clear Finished"); b.clicked.connect(self.clear_finished_tasks); h.addWidget(b); l.addLayout(h)
         self.task_scroll = QScrollArea(); self.task_scroll.setWidgetResizable(True); self.task_container = QWidget(); self.task_layout = QVBoxLayout(self.task_container); self.task_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
         self.task_scroll.setWidget(self.task_container); l.addWidget(self.task_scroll)
 
     def setup_history(self, parent):
-        l = QVBoxLayout(parent); h = QHBoxLayout(); b = QPushButton("Refresh"); b.clicked.connect(self.refresh_history); h.addWidget(b); l.addLayout(h)
-        self.hist_scroll = QScrollArea(); self.hist_scroll.setWidgetResizable(True); self.hist_container = QWidget(); self.hist_layout = QVBoxLayout(self.hist_container); self.hist_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.hist_scroll.setWidget(self.hist_container); l.addWidget(self.hist_scroll); self.refresh_history()
+        l = QVBoxLayout(parent); h = QHBoxLayout()
+        self.hist_search = QLineEdit(); self.hist_search.setPlaceholderText("Search title..."); h.addWidget(self.hist_search)
+        self.hist_platform = QComboBox(); self.hist_platform.addItems(["All Platforms", *core.PLATFORM_HOSTS, "Generic"]); h.addWidget(self.hist_platform)
+        bo = QPushButton("Open"); bo.clicked.connect(self.open_selected_history); h.addWidget(bo)
+        bd = QPushButton("Delete"); bd.setStyleSheet("background:#550000"); bd.clicked.connect(self.delete_history_item); h.addWidget(bd)
+        b = QPushButton("Refresh"); b.clicked.connect(self.refresh_history); h.addWidget(b); l.addLayout(h)
+        self.hist_view = QTableView(); self.hist_view.verticalHeader().hide(); self.hist_view.setShowGrid(False)
+        self.hist_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows); self.hist_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.hist_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers); self.hist_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.hist_view.doubleClicked.connect(lambda idx: self.open_selected_history()); l.addWidget(self.hist_view)
+        # Debounce typing so filtering runs one query, not one per keystroke
+        self.hist_filter_timer = QTimer(self); self.hist_filter_timer.setSingleShot(True); self.hist_filter_timer.setInterval(250); self.hist_filter_timer.timeout.connect(self.refresh_history)
+        self.hist_search.textChanged.connect(lambda _: self.hist_filter_timer.start()); self.hist_platform.currentIndexChanged.connect(lambda _: self.refresh_history())
+        if self.history_model: self.hist_view.setModel(self.history_model)
 
     # ================= LOGIC & SLOTS =================
     def start_download(self, inp, fmt, res, sub=False, thm=False, mode='normal'):
-        u = inp.text().strip(); 
-        if not u: return
-        inp.clear(); self.tabs.setCurrentWidget(self.tab_tasks); tid = str(uuid.uuid4())
-        w = self.create_task_widget(tid, mode); self.task_layout.addWidget(w['frame'])
-        opts = {'download_path': self.settings.get("download_path"), 'format': fmt, 'resolution': res, 'proxy': self.settings.get("proxy"), 'cookies_path': self.settings.get("cookies_path"), 'embed_subs': sub, 'save_thumbnail': thm, 'mode': mode}
-        cb = {'progress': self.signals.progress.emit, 'finished': self.signals.finished.emit, 'log': self.signals.log.emit}
-        t = core.DownloaderEngine(tid, u, opts, cb); self.active_tasks[tid] = {'thread': t, 'widget': w}; t.start()
+        text = inp.text().strip()
+        if not text: return
+        inp.clear(); self.tabs.setCurrentWidget(self.tab_tasks)
+        # A pasted batch of links becomes one job per link; anything else goes to yt-dlp as typed
+        self.queue_urls(core.extract_urls(text) or [text], fmt, res, sub, thm, mode)
+
+    def queue_urls(self, urls, fmt, res, sub=False, thm=False, mode='normal'):
+        opts = self.services.options(format=fmt, resolution=res, embed_subs=sub, save_thumbnail=thm, mode=mode)
+        priority = 1 if mode == 'thumbnail' else 0
+        for u in urls:
+            tid = str(uuid.uuid4()); self.journal.add(tid, u, opts, priority); self.enqueue(tid, u, opts, priority)
+
+    def enqueue(self, tid, url, opts, priority=0):
+        self.ensure_tab(self.tab_tasks)
+        w = self.create_task_widget(tid, opts.get('mode', 'normal')); self.task_layout.addWidget(w['frame'])
+        cb = {'finished': self.signals.finished.emit, 'log': self.signals.log.emit, 'state': self.signals.state.emit, 'entry': self.signals.entry.emit}
+        t = self.services.engine(tid, url, opts, cb); self.active_tasks[tid] = {'thread': t, 'widget': w}
+        # Dedup needs history; jobs queued before it has opened (restored jobs, early clipboard links) wait for it
+        if self.history is None: self.held_jobs.append((t, priority))
+        else: self.scheduler.submit(t, priority)
+        self.update_queue_label()
+        if not self.progress_timer.isActive(): self.progress_timer.start()
+
+    def start_thumbnail_batch(self):
+        text = self.thumb_batch.toPlainText().strip(); urls = core.extract_urls(text) or ([text] if text else [])
+        if not urls or self.thumb_job: return
+        self.thumb_job = self.services.thumbnails(self.services.options())
+        self.thumb_counts = [0, 0]; self.thumb_pb.setRange(0, 0); self.lbl_thumb.setText(f"Listing {len(urls)} link{'s' if len(urls) > 1 else ''}...")
+        self.btn_thumb_batch.setEnabled(False); self.btn_thumb_cancel.setEnabled(True)
+        threading.Thread(target=self._thumb_worker, args=(self.thumb_job, urls), daemon=True).start()
+    def _thumb_worker(self, job, urls):
+        results = []
+        try: results = job.run(urls, self.signals.thumb_item.emit)
+        finally: self.signals.thumb_done.emit(len(results))
+    def on_thumb_item(self, res):
+        self.thumb_counts[0 if res['path'] else 1] += 1
+        if res['path']: self.record_history(core.thumbnail_entry(res))
+        self.lbl_thumb.setText(f"Saved: {self.thumb_counts[0]}  |  Failed: {self.thumb_counts[1]}  |  {res['title'][:50]}")
+    def on_thumb_done(self, total):
+        self.thumb_job = None; self.thumb_pb.setRange(0, 100); self.thumb_pb.setValue(100)
+        self.btn_thumb_batch.setEnabled(True); self.btn_thumb_cancel.setEnabled(False); self.thumb_batch.clear()
+        self.lbl_thumb.setText(f"Done: {self.thumb_counts[0]} saved, {self.thumb_counts[1]} failed of {total}")
+
+    def on_playlist_entry(self, parent, url, title):
+        # Already queued (e.g. a playlist re-listed after a restart) -> nothing to do
+        if parent not in self.active_tasks or self.journal.is_active(url): return
+        opts = dict(self.active_tasks[parent]['thread'].options); tid = str(uuid.uuid4())
+        self.journal.add(tid, url, opts); self.enqueue(tid, url, opts)
+        self.active_tasks[tid]['widget']['title'].setText(title[:60])
+
+    def restore_jobs(self):
+        self.journal.prune()
+        jobs = self.journal.pending()
+        for job in jobs: self.enqueue(job['id'], job['url'], job['options'], job['priority']); self.active_tasks[job['id']]['widget']['title'].setText(f"Resuming: {job['url'][:50]}")
+        if jobs: self.tabs.setCurrentWidget(self.tab_tasks)
 
     def create_task_widget(self, tid, mode):
         f = QFrame(); f.setStyleSheet("QFrame { background-color: #1E1E1E; border: 1px solid #333; border-radius: 5px; }"); l = QVBoxLayout(f)
         h = QHBoxLayout(); p = "[Thumb] " if mode=='thumbnail' else ""; title = QLabel(f"{p}Init..."); title.setStyleSheet("border:none;font-weight:bold"); h.addWidget(title)
         btn = QPushButton("Cancel"); btn.setStyleSheet("background-color: #8B0000; border: none;"); btn.setFixedWidth(60); btn.clicked.connect(lambda: self.cancel_task(tid)); h.addWidget(btn); l.addLayout(h)
-        pb = QProgressBar(); pb.setValue(0); l.addWidget(pb); stat = QLabel("Waiting..."); stat.setStyleSheet("border:none;color:#888"); l.addWidget(stat)
+        pb = QProgressBar(); pb.setValue(0); l.addWidget(pb); stat = QLabel("Queued..."); stat.setStyleSheet("border:none;color:#888"); l.addWidget(stat)
         return {'frame': f, 'title': title, 'pbar': pb, 'status': stat, 'btn': btn}
 
-    def on_task_progress(self, tid, pct, spd):
-        if tid in self.active_tasks: self.active_tasks[tid]['widget']['pbar'].setValue(pct); self.active_tasks[tid]['widget']['status'].setText(f"Speed: {spd}")
+    def on_progress_tick(self):
+        snap = self.progress.snapshot(); allocated = self.rates.allocations()
+        for tid, (pct, done, total, spd, eta) in snap.items():
+            if tid in self.active_tasks:
+                w = self.active_tasks[tid]['widget']; w['pbar'].setValue(pct); cap = f" (cap {core.format_size(allocated[tid])}/s)" if allocated.get(tid) else ""
+                w['status'].setText(f"Speed: {core.format_size(spd)}/s{cap}  |  {core.format_size(done)} / {core.format_size(total)}  |  ETA: {core.format_eta(eta)}")
+        st = self.scheduler.stats()
+        if not snap and not st['running'] and not st['queued'] and not self.held_jobs: self.progress_timer.stop()
+    def on_task_state(self, tid, state):
+        labels = {'running': "Starting...", 'waiting_cpu': "Downloaded, waiting for a processing slot...", 'postprocessing': "Processing (merge/convert)..."}
+        if tid in self.active_tasks and state in labels: self.active_tasks[tid]['widget']['status'].setText(labels[state])
+        if state in ('waiting_cpu', 'postprocessing'): self.progress.remove(tid)
+        self.update_queue_label()
+    def update_queue_label(self):
+        st = self.scheduler.stats(); pp = self.pp_pool.stats(); bw = self.rates.stats()
+        limit = f"  |  Limit: {core.format_size(bw['limit'])}/s" if bw['limit'] else ""
+        self.lbl_queue.setText(f"Running: {st['running']}/{st['slots']}  |  Queued: {st['queued'] + len(self.held_jobs)}  |  Processing: {pp['running']}/{pp['workers']} ({pp['queued']} waiting){limit}")
     def on_task_log(self, tid, msg):
         if tid in self.active_tasks: self.active_tasks[tid]['widget']['title'].setText(msg[:60])
     def on_task_finished(self, tid, res, ok):
         if tid in self.active_tasks:
-            w = self.active_tasks[tid]['widget']; w['btn'].setEnabled(False); w['btn'].setStyleSheet("background-color:#333")
-            if ok: self.history.add(res); w['pbar'].setValue(100); w['status'].setText("Complete"); w['status'].setStyleSheet("border:none;color:#0078D7")
+            self.progress.remove(tid); w = self.active_tasks[tid]['widget']; w['btn'].setEnabled(False); w['btn'].setStyleSheet("background-color:#333")
+            if ok and not res.get('playlist') and res.get('duplicate') != 'skip': self.record_history(res)
+            if ok: w['pbar'].setValue(100); w['status'].setText("Already Downloaded" if res.get('duplicate') else "Complete"); w['status'].setStyleSheet("border:none;color:#0078D7")
             else: w['status'].setText("Failed/Stopped"); w['status'].setStyleSheet("border:none;color:#FF0000")
-    def cancel_task(self, tid): self.active_tasks[tid]['thread'].cancelled = True; self.active_tasks[tid]['widget']['status'].setText("Stopping...")
+        self.update_queue_label(); self.update_cache_label(); self.update_metrics_label()
+    def cancel_task(self, tid):
+        t = self.active_tasks[tid]['thread']; self.active_tasks[tid]['widget']['status'].setText("Stopping...")
+        held = [j for j in self.held_jobs if j[0] is t]
+        if not held: self.scheduler.cancel(t); return
+        self.held_jobs.remove(held[0]); t.cancelled = True; t.state = 'cancelled'
+        self.journal.transition(tid, ('queued',), 'cancelled'); self.on_task_finished(tid, {}, False)
     def clear_finished_tasks(self):
-        d = [k for k,v in self.active_tasks.items() if not v['thread'].is_alive()]
+        d = [k for k,v in self.active_tasks.items() if v['thread'].state in ('done', 'cancelled')]
         for k in d: self.active_tasks[k]['widget']['frame'].deleteLater(); del self.active_tasks[k]
     
     # App Update
@@ -224,30 +425,80 @@ class OnyxApp(QMainWindow):
         else: self.btn_app_upd.setEnabled(True); self.btn_app_upd.setText(f"Check Updates (v{core.VERSION})")
     def start_app_update(self, url):
         self.dl_d = QDialog(self); self.dl_d.setWindowTitle("Updating..."); self.dl_d.resize(300, 100); l = QVBoxLayout(self.dl_d); l.addWidget(QLabel("Downloading...")); self.dl_pb = QProgressBar(); l.addWidget(self.dl_pb); self.dl_d.show()
-        threading.Thread(target=lambda: self.updater.download_and_install(url, self.update_dl_progress)).start()
+        threading.Thread(target=lambda: self.signals.app_update_done.emit(*self.updater.download_and_install(url, self.signals.app_update_progress.emit)), daemon=True).start()
     def update_dl_progress(self, v): self.dl_pb.setValue(v)
+    def on_app_update_done(self, ok, msg):
+        self.dl_d.close()
+        if ok: QApplication.quit()
+        else: self.on_update_result(False, f"Update failed: {msg}")
     def on_update_result(self, s, m): self.btn_app_upd.setEnabled(True); self.btn_app_upd.setText(f"Check Updates (v{core.VERSION})"); QMessageBox.information(self, "Info", m)
 
     # Utils
+    def on_history_ready(self, history):
+        self.history = self.services.history = history; self.history_model = HistoryModel(history)
+        threading.Thread(target=history.rebuild_index, args=(self.settings.get("download_path"), self.settings.get("dedup_hash")), daemon=True).start()
+        for res in self.pending_history: self.record_history(res)
+        for t, priority in self.held_jobs: t.history = history; self.scheduler.submit(t, priority)
+        if self.held_jobs and not self.progress_timer.isActive(): self.progress_timer.start()
+        self.pending_history = []; self.held_jobs = []
+        if self.tab_history not in self.tab_builders: self.hist_view.setModel(self.history_model); self.refresh_history()
+    def record_history(self, res):
+        if not self.history: self.pending_history.append(res); return
+        self.history.add(res); self.history_model.prepend(res)
     def refresh_history(self):
-        while self.hist_layout.count(): c=self.hist_layout.takeAt(0); c.widget().deleteLater() if c.widget() else None
-        for i, it in enumerate(self.history.history):
-            f=QFrame(); f.setStyleSheet("background:#1E1E1E;border-bottom:1px solid #333"); l=QHBoxLayout(f)
-            lbl=QLabel(f"{it['title'][:50]}...\n{it.get('size','')} - {it.get('date','')}"); lbl.setStyleSheet("border:none"); l.addWidget(lbl)
-            bo=QPushButton("Open"); bo.setFixedWidth(60); bo.clicked.connect(lambda _,p=it['path']:self.open_file(p)); l.addWidget(bo)
-            bd=QPushButton("Del"); bd.setFixedWidth(60); bd.setStyleSheet("background:#550000"); bd.clicked.connect(lambda _,x=i:self.delete_history_item(x)); l.addWidget(bd)
-            self.hist_layout.addWidget(f)
-    def delete_history_item(self, i): self.history.delete(i); self.refresh_history()
+        if not self.history_model: return
+        p = self.hist_platform.currentText()
+        self.history_model.set_filter(self.hist_search.text().strip(), "" if p == "All Platforms" else p)
+    def selected_history_row(self):
+        sm = self.hist_view.selectionModel(); rows = sm.selectedRows() if sm else []
+        return rows[0].row() if rows else -1
+    def open_selected_history(self):
+        it = self.history_model.entry(self.selected_history_row()) if self.history_model else None
+        if it: self.open_file(it['path'])
+    def delete_history_item(self):
+        row = self.selected_history_row(); it = self.history_model.entry(row) if self.history_model else None
+        if it and self.history.delete(it['id']): self.history_model.remove(row)
+    def update_cache_label(self):
+        if self.tab_network in self.tab_builders: return
+        st = self.metadata_cache.stats(); self.lbl_cache.setText(f"{st['entries']} entries ({core.format_size(st['bytes'])})  |  Hits: {st['hits']}  |  Misses: {st['misses']}")
+    def update_metrics_label(self):
+        if self.tab_network in self.tab_builders: return
+        if not self.metrics: self.lbl_metrics.setText("Metrics are off (metrics_enabled in settings.json)"); return
+        def p(m, k, fmt): return f"{fmt(m[k]['p50'])} / {fmt(m[k]['p95'])}" if k in m else "-"
+        lines = [f"{name}: {m['jobs']} jobs, {m['failed']} failed  |  Start p50/p95: {p(m, 'ttfb_s', lambda v: f'{v:.1f}s')}  |  Total: {p(m, 'total_s', core.format_eta)}  |  Speed: {p(m, 'speed_bps', lambda v: core.format_size(v) + '/s')}"
+                 for name, m in sorted(self.metrics.summary().items())]
+        self.lbl_metrics.setText("\n".join(lines) or "No finished downloads yet.")
+    def clear_metadata_cache(self): self.metadata_cache.clear(); self.update_cache_label()
     def browse_cookies(self): f,_=QFileDialog.getOpenFileName(self,"Cookies","","Text (*.txt)"); self.net_cookie.setText(f) if f else None
-    def save_settings(self): self.settings.set("proxy", self.net_proxy.text()); self.settings.set("cookies_path", self.net_cookie.text()); QMessageBox.information(self,"Saved","Done")
+    def save_settings(self):
+        self.settings.set("proxy", self.net_proxy.text()); self.settings.set("cookies_path", self.net_cookie.text()); self.settings.set("max_concurrent", int(self.net_parallel.currentText()))
+        self.settings.set("dedup_policy", DEDUP_POLICIES[self.net_dedup.currentText()]); self.settings.set("dedup_hash", self.net_hash.isChecked())
+        self.settings.set("clipboard_auto_enqueue", self.net_clip.isChecked())
+        try: self.settings.set("rate_limit_kbps", max(0, int(self.net_limit.text().strip() or 0)))
+        except ValueError: self.net_limit.setText(str(self.settings.get("rate_limit_kbps")))
+        self.rates.configure(**core.rate_limits(self.settings))
+        self.scheduler.configure(max_workers=self.settings.get("max_concurrent")); QMessageBox.information(self,"Saved","Done")
     def open_file(self, p): os.startfile(p) if os.path.exists(p) and platform.system()=="Windows" else None
     def start_clipboard_monitor(self):
-        def m():
-            l=""; 
-            while self.clipboard_monitor_active:
-                try: t=pyperclip.paste().strip(); (lambda:None)() if t!=l and "http" in t else None; l=t
-                except:pass; time.sleep(1)
-        threading.Thread(target=m, daemon=True).start()
+        # Qt signals clipboard changes; the debounce folds the bursts some apps emit on a single copy
+        self.clip_timer = QTimer(self); self.clip_timer.setSingleShot(True); self.clip_timer.setInterval(300); self.clip_timer.timeout.connect(self.on_clipboard_changed)
+        QApplication.clipboard().dataChanged.connect(self.clip_timer.start)
+    def on_clipboard_changed(self):
+        text = QApplication.clipboard().text().strip()
+        if text == self.clip_last: return
+        self.clip_last = text; urls = core.extract_urls(text)
+        if not urls: return
+        if self.settings.get("clipboard_auto_enqueue"):
+            urls = [u for u in urls if not self.journal.is_active(u)]
+            if urls: self.queue_urls(urls, self.settings.get("format"), self.settings.get("resolution")); self.tabs.setCurrentWidget(self.tab_tasks)
+        elif not self.dash_input.text().strip():
+            self.dash_input.setText(" ".join(urls))
+            platforms = sorted({core.detect_platform(u) for u in urls})
+            self.dash_clip.setText(f"Copied: {len(urls)} link{'s' if len(urls) > 1 else ''} ({', '.join(platforms)})")
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv); app.setStyleSheet(STYLESHEET); w = OnyxApp(); w.show(); sys.exit(app.exec())
+    app = QApplication(sys.argv); app.setStyleSheet(STYLESHEET)
+    if STARTUP_TRACE: STARTUP_TRACE.mark("qapplication")
+    w = OnyxApp(); w.show()
+    if STARTUP_TRACE: STARTUP_TRACE.mark("window_shown")
+    sys.exit(app.exec())
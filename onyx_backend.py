@@ -7,11 +7,18 @@ import re
 import sys
 import subprocess
 import time
-import requests
-import zipfile
-import shutil
+import heapq
+import queue
+import struct
+import itertools
+import random
+import sqlite3
+import copy
+import hashlib
+import functools
 from datetime import datetime
-import yt_dlp
+from urllib.parse import urlparse, urlencode, parse_qsl
+# yt_dlp, requests, zipfile and shutil are imported where first used to keep startup fast
 
 # ================= CONSTANTS =================
 APP_NAME = "Onyx Qt"
@@ -24,6 +31,7 @@ LATEST_RELEASE_API = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/
 
 # FFmpeg Direct Download Link
 FFMPEG_URL = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
+FFMPEG_SHA256_URL = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/checksums.sha256"
 
 if getattr(sys, 'frozen', False):
     BASE_DIR = os.path.dirname(sys.executable)
@@ -33,6 +41,14 @@ else:
 DEFAULT_DOWNLOAD_DIR = os.path.join(os.path.expanduser("~"), "Downloads", "OnyxMedia")
 SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
 HISTORY_FILE = os.path.join(BASE_DIR, "history.json")
+HISTORY_DB = os.path.join(BASE_DIR, "history.db")
+JOBS_DB = os.path.join(BASE_DIR, "jobs.db")
+METADATA_CACHE_DB = os.path.join(BASE_DIR, "metadata_cache.db")
+UPDATE_CACHE_FILE = os.path.join(BASE_DIR, "update_cache.json")
+STARTUP_TRACE_FILE = os.path.join(BASE_DIR, "startup_trace.json")
+METRICS_FILE = os.path.join(BASE_DIR, "metrics.jsonl")
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
+TUNING_FILE = os.path.join(BASE_DIR, "tuning.json")
 FFMPEG_EXE = os.path.join(BASE_DIR, "ffmpeg.exe")
 
 # ================= UTILS =================
@@ -42,12 +58,17 @@ def clean_text(text):
     return ansi_escape.sub('', text)
 
 def format_size(size_bytes):
-    if size_bytes == 0: return "0B"
+    if not size_bytes or size_bytes < 1: return "0B"
     size_name = ("B", "KB", "MB", "GB", "TB")
     i = int(math.floor(math.log(size_bytes, 1024)))
     p = math.pow(1024, i)
     return "%s %s" % (round(size_bytes / p, 2), size_name[i])
 
+def format_eta(seconds):
+    if seconds is None: return "--:--"
+    m, s = divmod(int(seconds), 60); h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
 def get_timestamp():
     return datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -59,11 +80,262 @@ def delete_file(path):
     except: return False
     return False
 
+PLATFORM_HOSTS = {"YouTube": ("youtube.com", "youtu.be", "youtube-nocookie.com"), "TikTok": ("tiktok.com",), "Instagram": ("instagram.com", "instagr.am")}
+# Host (or any subdomain of it) -> platform, one match for all platforms
+PLATFORM_RE = re.compile(r"^(?:[\w-]+\.)*(?:" + "|".join(f"(?P<{name}>{'|'.join(map(re.escape, hosts))})" for name, hosts in PLATFORM_HOSTS.items()) + r")$", re.IGNORECASE)
+URL_RE = re.compile(r"https?://[\w-]+(?:\.[\w-]+)+(?::\d+)?(?:[/?#][^\s<>\"'`]*)?", re.IGNORECASE)
+
 def detect_platform(url):
-    if "youtube" in url or "youtu.be" in url: return "YouTube"
-    if "tiktok" in url: return "TikTok"
-    if "instagram" in url: return "Instagram"
-    return "Generic"
+    try: m = PLATFORM_RE.match(urlparse(url).hostname or "")
+    except ValueError: return "Generic"
+    return m.lastgroup if m else "Generic"
+
+def extract_urls(text):
+    # Every link in a paste (one per line, space separated or inside prose), in order and without repeats
+    urls, seen = [], set()
+    for m in URL_RE.finditer(text or ""):
+        url = m.group(0).rstrip(".,;:!?'\"")
+        while url.endswith(")") and url.count("(") < url.count(")"): url = url[:-1]
+        key = normalize_url(url)
+        if key not in seen: seen.add(key); urls.append(url)
+    return urls
+
+def url_host(url):
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def host_key(url):
+    # Known platforms count as one site whatever the share link (youtu.be, m./music.youtube.com); others by host
+    platform_name = detect_platform(url)
+    return platform_name if platform_name != "Generic" else url_host(url)
+
+TRACKING_PARAMS = {"si", "feature", "fbclid", "igshid", "igsh", "is_from_webapp", "sender_device"}
+
+def normalize_url(url):
+    u = urlparse(url.strip())
+    host = url_host(url)
+    if host.startswith("m."): host = host[2:]
+    path = u.path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(u.query, keep_blank_values=True) if k not in TRACKING_PARAMS and not k.startswith("utm_"))
+    if host == "youtu.be" and path:
+        host, query, path = "youtube.com", [("v", path.strip("/"))] + query, "/watch"
+    return f"{(u.scheme or 'https').lower()}://{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+def iter_entries(entries, window=50):
+    # Playlist entries may be a list, a generator/LazyList or a PagedList; only PagedList
+    # needs explicit windows to avoid fetching every page up front
+    if entries is None: return
+    if hasattr(entries, 'getslice'):
+        for start in itertools.count(0, window):
+            batch = entries.getslice(start, start + window)
+            yield from batch
+            if len(batch) < window: return
+    else: yield from entries
+
+# Only these extractor modules are loaded to read an id from a URL; the full extractor list takes ~0.5 s to import
+PLATFORM_EXTRACTORS = {"YouTube": ("yt_dlp.extractor.youtube", "YoutubeIE"), "TikTok": ("yt_dlp.extractor.tiktok", "TikTokIE"), "Instagram": ("yt_dlp.extractor.instagram", "InstagramIE")}
+
+@functools.lru_cache(maxsize=4096)
+def url_media_id(url):
+    # (extractor, video id) from the URL alone for the known platforms; no network. Anything else is
+    # identified after extraction
+    target = PLATFORM_EXTRACTORS.get(detect_platform(url))
+    if target:
+        try:
+            import importlib
+            ie = getattr(importlib.import_module(target[0]), target[1])
+            if ie.suitable(url): return ie.ie_key(), str(ie.get_temp_id(url) or "")
+        except: pass
+    return 'Generic', ""
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""): h.update(block)
+    return h.hexdigest()
+
+def write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f: json.dump(data, f)
+    os.replace(tmp, path)
+
+# ================= RANGED DOWNLOADER =================
+class RangedDownloader:
+    # Parallel HTTP Range download into a preallocated file. Finished byte ranges are kept in
+    # a sidecar state file so an interrupted transfer resumes where it stopped.
+    def __init__(self, url, path, connections=4, piece_size=4 * 1024 * 1024, chunk_size=256 * 1024, timeout=30, retries=3, sha256=None):
+        self.url = url; self.path = path; self.state_path = path + ".state.json"
+        self.connections = connections; self.piece_size = piece_size; self.chunk_size = chunk_size
+        self.timeout = timeout; self.retries = retries; self.sha256 = sha256
+        self.size = 0; self.etag = ""; self.ranges_supported = False
+        self.done = []
+        self.lock = threading.Lock()
+        import requests
+        self.session = requests.Session()
+
+    def probe(self):
+        r = self.session.get(self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout)
+        r.raise_for_status()
+        content_range = r.headers.get('Content-Range', "")
+        if r.status_code == 206 and "/" in content_range and not content_range.endswith("*"):
+            self.size = int(content_range.rsplit("/", 1)[1]); self.ranges_supported = True
+        else: self.size = int(r.headers.get('Content-Length', 0))
+        self.etag = r.headers.get('ETag', "")
+        r.close()
+        self.load_state()
+        return self.size
+
+    def load_state(self):
+        self.done = []
+        if not os.path.exists(self.state_path) or not os.path.exists(self.path): return
+        try:
+            with open(self.state_path, 'r') as f: state = json.load(f)
+            if state.get('url') == self.url and state.get('size') == self.size and state.get('etag') == self.etag:
+                self.done = [tuple(r) for r in state.get('done', [])]
+        except: self.done = []
+
+    def save_state(self):
+        try: write_json_atomic(self.state_path, {'url': self.url, 'size': self.size, 'etag': self.etag, 'done': self.done})
+        except: pass
+
+    def mark_done(self, start, end):
+        ranges = sorted(self.done + [(start, end)]); merged = []
+        for s, e in ranges:
+            if merged and s <= merged[-1][1]: merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else: merged.append((s, e))
+        self.done = merged
+
+    def missing(self, start, end):
+        out = []
+        for s, e in self.done:
+            if e <= start or s >= end: continue
+            if s > start: out.append((start, s))
+            start = max(start, e)
+        if start < end: out.append((start, end))
+        return out
+
+    def is_complete(self, start, end):
+        with self.lock: return not self.missing(start, end)
+
+    def done_bytes(self, ranges):
+        return sum((e - s) - sum(me - ms for ms, me in self.missing(s, e)) for s, e in ranges)
+
+    def download(self, ranges=None, progress_callback=None):
+        # ranges: [(start, end)] half-open byte ranges to fetch; None means the whole file
+        if not self.size: self.probe()
+        if not self.ranges_supported or not self.size: return self.download_stream(progress_callback)
+        wanted = ranges or [(0, self.size)]
+        mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        with open(self.path, mode) as f: f.truncate(self.size)
+        preallocate(self.path, self.size)
+        pieces = queue.Queue()
+        with self.lock:
+            for start, end in wanted:
+                for s, e in self.missing(start, end):
+                    for p in range(s, e, self.piece_size): pieces.put((p, min(p + self.piece_size, e)))
+            total = sum(e - s for s, e in wanted); state = {'done': self.done_bytes(wanted), 'error': None, 'saved': time.monotonic()}
+        if progress_callback and total: progress_callback(int(state['done'] * 100 / total))
+
+        def worker():
+            with open(self.path, 'r+b') as f:
+                while state['error'] is None:
+                    try: start, end = pieces.get_nowait()
+                    except queue.Empty: return
+                    for attempt in range(self.retries + 1):
+                        try:
+                            start = self.fetch_piece(f, start, end, state, wanted, total, progress_callback)
+                            break
+                        except Exception as e:
+                            if attempt == self.retries: state['error'] = e
+                            else: time.sleep(min(2 ** attempt, 10))
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(self.connections, pieces.qsize())))]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.save_state()
+        if state['error'] is not None: raise state['error']
+        if ranges is None: self.finish()
+        return self.path
+
+    def fetch_piece(self, f, start, end, state, wanted, total, progress_callback):
+        r = self.session.get(self.url, headers={'Range': f'bytes={start}-{end - 1}'}, stream=True, timeout=self.timeout)
+        if r.status_code != 206: raise IOError(f"Server ignored range request (HTTP {r.status_code})")
+        pos = start
+        for chunk in r.iter_content(self.chunk_size):
+            if not chunk: continue
+            chunk = chunk[:end - pos]
+            f.seek(pos); f.write(chunk)
+            with self.lock:
+                self.mark_done(pos, pos + len(chunk)); pos += len(chunk)
+                state['done'] = self.done_bytes(wanted)
+                if time.monotonic() - state['saved'] > 1: f.flush(); self.save_state(); state['saved'] = time.monotonic()
+            if progress_callback and total: progress_callback(int(state['done'] * 100 / total))
+            if pos >= end: break
+        r.close()
+        if pos < end: raise IOError("Connection closed early")
+        return pos
+
+    def download_stream(self, progress_callback=None):
+        # Server without Range support: plain single stream, no resume
+        r = self.session.get(self.url, stream=True, timeout=self.timeout)
+        r.raise_for_status()
+        total = int(r.headers.get('content-length', 0)); wrote = 0
+        with open(self.path, 'wb') as f:
+            for chunk in r.iter_content(self.chunk_size):
+                if chunk:
+                    f.write(chunk); wrote += len(chunk)
+                    if progress_callback and total > 0: progress_callback(int(wrote * 100 / total))
+        self.finish()
+        return self.path
+
+    def finish(self):
+        if self.sha256:
+            if file_sha256(self.path).lower() != self.sha256.lower():
+                self.cleanup()
+                raise IOError("Checksum mismatch")
+        delete_file(self.state_path)
+
+    def cleanup(self):
+        delete_file(self.path); delete_file(self.state_path)
+
+# ================= STARTUP TRACE =================
+class StartupTrace:
+    # Enabled with --trace-startup or ONYX_STARTUP_TRACE=1. Times each top-level import
+    # (inclusive of what it pulls in) and named milestones such as first paint.
+    def __init__(self, t0=None):
+        self.t0 = t0 or time.perf_counter()
+        self.imports = {}; self.marks = []
+        self.depth = 0; self.original = None
+
+    def install(self):
+        import builtins
+        self.original = original = builtins.__import__
+        def traced(name, globals=None, locals=None, fromlist=(), level=0):
+            if self.depth or level or name in sys.modules: return original(name, globals, locals, fromlist, level)
+            self.depth += 1; start = time.perf_counter()
+            try: return original(name, globals, locals, fromlist, level)
+            finally:
+                self.depth -= 1
+                self.imports[name] = self.imports.get(name, 0) + time.perf_counter() - start
+        builtins.__import__ = traced
+
+    def uninstall(self):
+        import builtins
+        if self.original: builtins.__import__ = self.original; self.original = None
+
+    def mark(self, label):
+        self.marks.append((label, round((time.perf_counter() - self.t0) * 1000, 1)))
+
+    def report(self):
+        imports = sorted(self.imports.items(), key=lambda kv: -kv[1])
+        return {'marks_ms': dict(self.marks), 'imports_ms': {k: round(v * 1000, 1) for k, v in imports}}
+
+    def write(self, path=STARTUP_TRACE_FILE):
+        report = self.report()
+        try: write_json_atomic(path, report)
+        except: pass
+        if sys.stderr: print(json.dumps(report, indent=2), file=sys.stderr)
+        return report
 
 # ================= DEPENDENCY MANAGER =================
 class DependencyManager:
@@ -71,41 +343,31 @@ class DependencyManager:
         return os.path.exists(FFMPEG_EXE)
 
     def download_ffmpeg(self, progress_callback, status_callback):
+        dl = None
         try:
             status_callback("Downloading FFmpeg (Required for 1080p)...")
             zip_path = os.path.join(BASE_DIR, "ffmpeg_temp.zip")
-            
-            r = requests.get(FFMPEG_URL, stream=True)
-            total_size = int(r.headers.get('content-length', 0))
-            downloaded = 0
-            chunk_size = 8192
-            
-            with open(zip_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            p = int((downloaded / total_size) * 100)
-                            progress_callback(p)
-            
+            dl = RangedDownloader(FFMPEG_URL, zip_path)
+            dl.probe()
+
+            if dl.ranges_supported:
+                # Only the zip directory and the ffmpeg.exe entry are needed, not the whole archive
+                status_callback("Reading archive index...")
+                entry = self.locate_entry(dl, "ffmpeg.exe")
+                if entry is None: return False, "Could not find ffmpeg.exe in zip"
+                status_callback("Downloading ffmpeg.exe...")
+                dl.download([entry], progress_callback)
+            else:
+                # Whole archive: check it against the checksum BtbN publishes with the build
+                dl.sha256 = self.published_sha256(FFMPEG_SHA256_URL, FFMPEG_URL.rsplit("/", 1)[1])
+                dl.download(progress_callback=progress_callback)
+
             status_callback("Extracting ffmpeg.exe...")
-            found = False
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    if file.endswith("ffmpeg.exe"):
-                        source = zip_ref.open(file)
-                        target = open(FFMPEG_EXE, "wb")
-                        shutil.copyfileobj(source, target)
-                        source.close()
-                        target.close()
-                        found = True
-                        break
-            
+            found = self.extract_entry(zip_path, "ffmpeg.exe", FFMPEG_EXE)
+
             status_callback("Cleaning up...")
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-            
+            dl.cleanup()
+
             if found:
                 return True, "Installed Successfully"
             else:
@@ -114,41 +376,155 @@ class DependencyManager:
         except Exception as e:
             return False, str(e)
 
+    def published_sha256(self, url, name):
+        # "<sha256>  <file name>" per line; None when the list is unreachable or lacks the file
+        try:
+            import requests
+            r = requests.get(url, timeout=15); r.raise_for_status()
+            for line in r.text.splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[1].lstrip("*") == name: return parts[0]
+        except: pass
+        return None
+
+    def locate_entry(self, dl, suffix):
+        # End of central directory record sits in the last 64 KB (+22 byte header) of the zip
+        tail = min(dl.size, 65536 + 22)
+        dl.download([(dl.size - tail, dl.size)])
+        with open(dl.path, 'rb') as f:
+            f.seek(dl.size - tail); data = f.read(tail)
+        pos = data.rfind(b"PK\x05\x06")
+        if pos < 0: raise IOError("Invalid zip archive")
+        cd_size, cd_offset = struct.unpack("<LL", data[pos + 12:pos + 20])
+        if cd_offset == 0xFFFFFFFF: return (0, dl.size)  # ZIP64: fall back to the whole archive
+        dl.download([(cd_offset, cd_offset + cd_size)])
+        import zipfile
+        with zipfile.ZipFile(dl.path, 'r') as zip_ref:
+            infos = sorted(zip_ref.infolist(), key=lambda i: i.header_offset)
+        for i, info in enumerate(infos):
+            if info.filename.endswith(suffix):
+                end = infos[i + 1].header_offset if i + 1 < len(infos) else cd_offset
+                return (info.header_offset, end)
+        return None
+
+    def extract_entry(self, zip_path, suffix, target_path):
+        # zipfile checks the entry CRC32 while reading, so a corrupt download raises here. With only one
+        # entry fetched the archive's published sha256 cannot be checked; the CRC covers corruption of the
+        # bytes we did fetch, and they come over HTTPS from the same release the checksum list would.
+        import zipfile, shutil
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for file in zip_ref.namelist():
+                if file.endswith(suffix):
+                    with zip_ref.open(file) as source, open(target_path + ".tmp", "wb") as target:
+                        shutil.copyfileobj(source, target)
+                    os.replace(target_path + ".tmp", target_path)
+                    return True
+        return False
+
 # ================= UPDATER =================
 class SelfUpdater:
+    def __init__(self, cache_path=UPDATE_CACHE_FILE):
+        self.cache_path = cache_path
+        self.release = {}
+
+    def fetch_release(self):
+        # Conditional request: an unchanged release costs a 304 with no body (and no rate limit)
+        cached = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as f: cached = json.load(f)
+            except: cached = {}
+        import requests
+        headers = {'If-None-Match': cached['etag']} if cached.get('etag') and cached.get('release') else {}
+        r = requests.get(LATEST_RELEASE_API, headers=headers, timeout=10)
+        if r.status_code == 304: return cached['release']
+        if r.status_code != 200: return None
+        data = r.json()
+        try: write_json_atomic(self.cache_path, {'etag': r.headers.get('ETag', ""), 'release': data})
+        except: pass
+        return data
+
     def check_for_updates(self):
         try:
-            r = requests.get(LATEST_RELEASE_API, timeout=10)
-            if r.status_code == 200:
-                data = r.json()
+            data = self.fetch_release()
+            if data:
                 remote_ver = data.get("tag_name", "").replace("v", "")
                 if remote_ver != VERSION:
-                    assets = data.get("assets", [])
-                    for asset in assets:
-                        if asset["name"].endswith(".exe"):
+                    assets = {a["name"]: a for a in data.get("assets", [])}
+                    for name, asset in assets.items():
+                        if name.endswith(".exe"):
+                            self.release = {'version': remote_ver, 'url': asset["browser_download_url"], 'size': asset.get("size", 0), 'digest': asset.get("digest") or "",
+                                            'checksum_url': assets.get(name + ".sha256", {}).get("browser_download_url", ""),
+                                            'manifest_url': assets.get(name + ".chunks.json", {}).get("browser_download_url", "")}
                             return True, remote_ver, asset["browser_download_url"]
             return False, VERSION, ""
         except: return False, VERSION, ""
 
+    def expected_sha256(self):
+        digest = self.release.get('digest', "")
+        if digest.startswith("sha256:"): return digest.split(":", 1)[1]
+        if self.release.get('checksum_url'):
+            import requests
+            r = requests.get(self.release['checksum_url'], timeout=10); r.raise_for_status()
+            return r.text.split()[0]
+        return None
+
     def download_and_install(self, url, progress_callback):
         try:
-            local_filename = "Onyx_Update.exe"
-            r = requests.get(url, stream=True)
-            total = int(r.headers.get('content-length', 0))
-            wrote = 0
-            with open(local_filename, 'wb') as f:
-                for d in r.iter_content(8192):
-                    wrote += len(d)
-                    f.write(d)
-                    if total > 0: progress_callback(int((wrote / total) * 100))
-            
+            local_filename = os.path.join(BASE_DIR, "Onyx_Update.exe")
+            sha = self.expected_sha256() if self.release.get('url') == url else None
+            if not sha: return False, "Update has no published checksum"
+            dl = RangedDownloader(url, local_filename, sha256=sha)
+            done = False
+            if self.release.get('manifest_url') and getattr(sys, 'frozen', False):
+                try: done = self.download_delta(dl, self.release['manifest_url'], sys.executable, progress_callback)
+                except Exception: dl.cleanup(); dl = RangedDownloader(url, local_filename, sha256=sha)
+            if not done: dl.download(progress_callback=progress_callback)
+
             current = sys.executable
+            bat_path = os.path.join(BASE_DIR, "updater.bat")
             bat = f'@echo off\ntimeout /t 2 /nobreak > NUL\ndel "{current}"\nmove "{local_filename}" "{current}"\nstart "" "{current}"\ndel "%~f0"'
-            with open("updater.bat", "w") as b: b.write(bat)
-            subprocess.Popen("updater.bat", shell=True)
-            sys.exit(0)
+            with open(bat_path, "w") as b: b.write(bat)
+            subprocess.Popen(f'"{bat_path}"', shell=True)
+            return True, "Restarting..."
         except Exception as e: return False, str(e)
 
+    def download_delta(self, dl, manifest_url, local_path, progress_callback):
+        # Copy every chunk of the running exe that also appears in the new build, fetch the rest by Range
+        import requests
+        r = requests.get(manifest_url, timeout=10); r.raise_for_status()
+        manifest = r.json()
+        if manifest.get('sha256', "").lower() != dl.sha256.lower(): return False
+        chunk_size = manifest['chunk_size']
+        local = {}
+        with open(local_path, 'rb') as f:
+            for offset in itertools.count(0, chunk_size):
+                block = f.read(chunk_size)
+                if not block: break
+                local.setdefault(hashlib.sha256(block).hexdigest(), offset)
+        dl.probe()
+        if not dl.ranges_supported or dl.size != manifest['size']: return False
+        mode = 'r+b' if os.path.exists(dl.path) else 'wb'
+        with open(local_path, 'rb') as src, open(dl.path, mode) as out:
+            out.truncate(dl.size)
+            for i, digest in enumerate(manifest['chunks']):
+                start = i * chunk_size; end = min(start + chunk_size, dl.size)
+                if digest in local and dl.missing(start, end):
+                    src.seek(local[digest]); out.seek(start); out.write(src.read(end - start))
+                    dl.mark_done(start, end)
+        dl.save_state()
+        dl.download([(0, dl.size)], progress_callback)
+        dl.finish()
+        return True
+
+def build_chunk_manifest(path, chunk_size=1024 * 1024):
+    # Published next to each release exe as <name>.chunks.json for delta updates
+    chunks, whole = [], hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            chunks.append(hashlib.sha256(block).hexdigest()); whole.update(block)
+    return {'version': VERSION, 'size': os.path.getsize(path), 'sha256': whole.hexdigest(), 'chunk_size': chunk_size, 'chunks': chunks}
+
 # ================= MANAGERS =================
 class SettingsManager:
     def __init__(self):
@@ -159,7 +535,26 @@ class SettingsManager:
             "proxy": "",
             "cookies_path": "",
             "embed_subs": False,
-            "save_thumbnail": False
+            "save_thumbnail": False,
+            "max_concurrent": 3,
+            "per_host_limit": 2,
+            "fragment_budget": 32,
+            "metadata_cache_ttl": 86400,
+            "metadata_cache_mb": 64,
+            "max_retries": 3,
+            "postprocess_workers": 0,
+            "dedup_policy": "skip",
+            "dedup_hash": False,
+            "clipboard_auto_enqueue": False,
+            "rate_limit_kbps": 0,
+            "host_rate_limits_kbps": {},
+            "rate_schedule": [],
+            "metrics_enabled": True,
+            "profile_jobs": "",
+            "adaptive_fragments": True,
+            "thumbnail_workers": 8,
+            "disk_reserve_mb": 512,
+            "preallocate": True
         }
         self.load()
 
@@ -183,54 +578,977 @@ class SettingsManager:
     def set(self, k, v): self.config[k] = v; self.save()
 
 class HistoryManager:
-    def __init__(self):
-        self.history = []
-        self.load()
+    # SQLite store; every write is its own transaction so a crash never leaves a half-written history
+    COLUMNS = ("title", "platform", "size", "path", "date", "url", "url_key", "extractor", "video_id", "content_hash")
+    INDEXED = ("url", "platform", "date", "path", "url_key", "content_hash")
 
-    def load(self):
-        if os.path.exists(HISTORY_FILE):
+    def __init__(self, path=HISTORY_DB, legacy_path=HISTORY_FILE):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, platform TEXT, size TEXT, path TEXT, date TEXT, url TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.upgrade()
+            for col in self.INDEXED:
+                self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_history_{col} ON history ({col})")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_media ON history (extractor, video_id)")
+        self.migrate(legacy_path)
+
+    def upgrade(self):
+        # Columns added after the first release of history.db
+        existing = {r['name'] for r in self.db.execute("PRAGMA table_info(history)")}
+        added = [c for c in self.COLUMNS if c not in existing]
+        for col in added: self.db.execute(f"ALTER TABLE history ADD COLUMN {col} TEXT DEFAULT ''")
+        if "url_key" in added:
+            rows = self.db.execute("SELECT id, url FROM history WHERE url != ''").fetchall()
+            self.db.executemany("UPDATE history SET url_key = ? WHERE id = ?", [(normalize_url(r['url']), r['id']) for r in rows])
+
+    def row(self, entry):
+        if entry.get('url') and not entry.get('url_key'): entry['url_key'] = normalize_url(entry['url'])
+        return tuple(entry.get(c) or "" for c in self.COLUMNS)
+
+    def insert_sql(self):
+        return f"INSERT INTO history ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' for _ in self.COLUMNS)})"
+
+    def migrate(self, legacy_path):
+        if not legacy_path or not os.path.exists(legacy_path): return
+        with self.lock: done = self.db.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone()
+        if not done:
             try:
-                with open(HISTORY_FILE, 'r') as f:
-                    self.history = json.load(f)
-            except: self.history = []
+                with open(legacy_path, 'r') as f: entries = json.load(f)
+            except: entries = []
+            # history.json is newest-first; insert oldest-first so ids keep the same order
+            rows = [self.row(e) for e in reversed(entries) if isinstance(e, dict)]
+            # The marker commits with the rows, so a failed rename below never imports them twice
+            with self.lock, self.db:
+                self.db.executemany(self.insert_sql(), rows)
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', ?)", (get_timestamp(),))
+        try: os.replace(legacy_path, legacy_path + ".migrated")
+        except: pass
 
     def add(self, entry):
-        self.history.insert(0, entry)
+        with self.lock, self.db:
+            cur = self.db.execute(self.insert_sql(), self.row(entry))
+        entry['id'] = cur.lastrowid
+        return entry['id']
+
+    def get(self, entry_id):
+        with self.lock:
+            row = self.db.execute("SELECT * FROM history WHERE id = ?", (entry_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _where(self, search="", platform=""):
+        clauses, args = [], []
+        if search: clauses.append("title LIKE ?"); args.append(f"%{search}%")
+        if platform: clauses.append("platform = ?"); args.append(platform)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def page(self, offset=0, limit=100, search="", platform=""):
+        where, args = self._where(search, platform)
+        with self.lock:
+            rows = self.db.execute(f"SELECT * FROM history{where} ORDER BY id DESC LIMIT ? OFFSET ?", args + [limit, offset]).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self, search="", platform=""):
+        where, args = self._where(search, platform)
+        with self.lock: return self.db.execute(f"SELECT COUNT(*) FROM history{where}", args).fetchone()[0]
+
+    def find_duplicates(self, url, extractor="", video_id=""):
+        # Same media (extractor + id) or same normalized URL; rows whose file is gone do not count.
+        # Generic ids are just the URL's file name (clip.mp4, index.m3u8), so those match on the URL only
+        clauses, args = ["url_key = ?"], [normalize_url(url)]
+        if extractor and video_id and extractor != 'Generic': clauses.append("(extractor = ? AND video_id = ?)"); args += [extractor, video_id]
+        with self.lock:
+            rows = self.db.execute(f"SELECT * FROM history WHERE {' OR '.join(clauses)} ORDER BY id DESC", args).fetchall()
+        return [dict(r) for r in rows if r['path'] and os.path.exists(r['path'])]
+
+    def rebuild_index(self, download_path, hash_files=False):
+        # Fill extractor/id for rows recorded before the dedup columns existed, then re-point rows whose
+        # file was renamed or moved inside download_path (matched by content hash)
+        with self.lock:
+            rows = self.db.execute("SELECT id, url FROM history WHERE extractor = '' AND url != ''").fetchall()
+        ids = [(*url_media_id(r['url']), r['id']) for r in rows]
+        with self.lock, self.db: self.db.executemany("UPDATE history SET extractor = ?, video_id = ? WHERE id = ?", ids)
+        with self.lock:
+            rows = self.db.execute("SELECT id, path, content_hash FROM history").fetchall()
+        known = {r['path'] for r in rows}
+        lost = {r['content_hash']: r['id'] for r in rows if r['content_hash'] and not os.path.exists(r['path'])}
+        moved = []
+        if hash_files and lost and os.path.isdir(download_path):
+            for root, _, files in os.walk(download_path):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if path in known or name.endswith(('.part', '.ytdl', '.tmp', '.state.json')): continue
+                    try: digest = file_sha256(path)
+                    except OSError: continue
+                    if digest in lost: moved.append((path, lost.pop(digest)))
+                if not lost: break
+        with self.lock, self.db: self.db.executemany("UPDATE history SET path = ? WHERE id = ?", moved)
+        return len(ids), len(moved)
+
+    def delete(self, entry_id):
+        entry = self.get(entry_id)
+        if not entry: return False
+        delete_file(entry['path'])
+        with self.lock, self.db: self.db.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+        return True
+
+    def close(self):
+        with self.lock: self.db.close()
+
+class MetadataCache:
+    # Raw extract_info results on disk, one SQLite row per URL, bounded by total size. Format URLs are
+    # signed and expire well before the metadata does, so they are tracked separately from the entry TTL.
+    def __init__(self, path=METADATA_CACHE_DB, ttl=86400, max_bytes=64 * 1024 * 1024, format_ttl=1800):
+        self.path = path; self.ttl = ttl; self.max_bytes = max_bytes; self.format_ttl = format_ttl
+        self.lock = threading.Lock()
+        self.db = None
+        self.hits = 0; self.misses = 0; self.stale_formats = 0
+
+    def open(self):
+        # Called on first use rather than at startup
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        with self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            # info last: size-only scans never read its overflow pages
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, url TEXT, time REAL, formats_expire REAL, used REAL, size INTEGER, info TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_entries_used ON entries (used)")
+
+    def key(self, url, options):
+        raw = json.dumps([normalize_url(url), options.get('cookies_path') or "", options.get('proxy') or ""])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, url, options, need_formats=True):
+        k = self.key(url, options); now = time.time()
+        with self.lock:
+            if self.db is None: self.open()
+            row = self.db.execute("SELECT time, formats_expire, info FROM entries WHERE key = ?", (k,)).fetchone()
+            if row and now - row[0] > self.ttl:
+                with self.db: self.db.execute("DELETE FROM entries WHERE key = ?", (k,))
+                row = None
+            if not row:
+                self.misses += 1; return None
+            formats_ok = row[1] > now
+            if need_formats and not formats_ok:
+                self.misses += 1; self.stale_formats += 1; return None
+            with self.db: self.db.execute("UPDATE entries SET used = ? WHERE key = ?", (now, k))
+            self.hits += 1
+        # Parsed per call, so every caller gets its own copy
+        info = json.loads(row[2])
+        if not formats_ok:
+            for f in ('formats', 'url', 'manifest_url'): info.pop(f, None)
+        return info
+
+    def put(self, url, options, info):
+        if not info or info.get('_type', 'video') != 'video': return
+        import yt_dlp
+        try:
+            data = yt_dlp.YoutubeDL.sanitize_info(info); raw = json.dumps(data)
+        except: return
+        if len(raw) > self.max_bytes: return
+        now = time.time()
+        with self.lock:
+            if self.db is None: self.open()
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO entries (key, url, time, formats_expire, used, size, info) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (self.key(url, options), normalize_url(url), now, self.formats_expire(data, now), now, len(raw), raw))
+                # Least recently used first until the cache fits
+                excess = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+                if excess > 0:
+                    stale = []
+                    for k, size in self.db.execute("SELECT key, size FROM entries ORDER BY used"):
+                        if excess <= 0: break
+                        stale.append((k,)); excess -= size
+                    self.db.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def formats_expire(self, info, now):
+        expires = [now + self.format_ttl]
+        for f in info.get('formats') or [info]:
+            for k, v in parse_qsl(urlparse(f.get('url') or "").query):
+                if k.lower() in ('expire', 'expires') and v.isdigit(): expires.append(int(v) - 60)
+        return min(expires) if info.get('formats') or info.get('url') else 0
+
+    def clear(self):
+        with self.lock:
+            if self.db is None: self.open()
+            with self.db: self.db.execute("DELETE FROM entries")
+
+    def stats(self):
+        with self.lock:
+            if self.db is None: self.open()
+            n, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {'entries': n, 'bytes': size, 'hits': self.hits, 'misses': self.misses, 'stale_formats': self.stale_formats}
+
+# ================= PROGRESS =================
+class ProgressAggregator:
+    # yt-dlp calls the progress hook for every chunk of every fragment. Engines write the raw
+    # byte counts here and the UI pulls one batched snapshot of the changed tasks per tick.
+    def __init__(self, window=0.5, alpha=0.3):
+        self.window = window; self.alpha = alpha
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.dirty = set()
+
+    def update(self, task_id, filename, downloaded, total, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            rec = self.tasks.get(task_id)
+            if rec is None: rec = self.tasks[task_id] = {'files': {}, 'bytes': 0, 'total': 0, 'speed': 0.0, 'eta': None, 'mark': (now, 0)}
+            # A merged download fetches video and audio as separate files; count both
+            rec['files'][filename] = (downloaded, total)
+            rec['bytes'] = sum(f[0] for f in rec['files'].values())
+            rec['total'] = sum(f[1] for f in rec['files'].values())
+            t0, b0 = rec['mark']
+            if now - t0 >= self.window:
+                rate = max(0.0, (rec['bytes'] - b0) / (now - t0))
+                rec['speed'] = rate if not rec['speed'] else self.alpha * rate + (1 - self.alpha) * rec['speed']
+                rec['mark'] = (now, rec['bytes'])
+            rec['eta'] = (rec['total'] - rec['bytes']) / rec['speed'] if rec['speed'] > 0 and rec['total'] > rec['bytes'] else None
+            self.dirty.add(task_id)
+
+    def remove(self, task_id):
+        with self.lock: self.tasks.pop(task_id, None); self.dirty.discard(task_id)
+
+    def snapshot(self):
+        # {task_id: (percent, bytes, total, speed, eta)} for tasks changed since the last call
+        with self.lock:
+            out = {}
+            for tid in self.dirty:
+                rec = self.tasks[tid]
+                pct = int(rec['bytes'] * 100 / rec['total']) if rec['total'] else 0
+                out[tid] = (min(pct, 100), rec['bytes'], rec['total'], rec['speed'], rec['eta'])
+            self.dirty.clear()
+        return out
+
+# ================= JOB JOURNAL =================
+class RetryPolicy:
+    # Bounded exponential backoff, used both for yt-dlp's own HTTP/fragment retries and for
+    # re-running a whole job. Errors that will never succeed on retry fail immediately.
+    PERMANENT = ("unsupported url", "private video", "video unavailable", "not available", "removed", "copyright", "sign in", "cancelled", "no space left", "not enough disk space")
+
+    def __init__(self, max_attempts=3, base=2.0, cap=60.0, http_retries=10, fragment_retries=10):
+        self.max_attempts = max_attempts; self.base = base; self.cap = cap
+        self.http_retries = http_retries; self.fragment_retries = fragment_retries
+
+    def delay(self, n):
+        # n is the zero-based retry number (yt-dlp passes it as a keyword)
+        return min(self.cap, self.base * (2 ** n)) * (0.75 + random.random() * 0.5)
+
+    def should_retry(self, attempt, error):
+        msg = str(error).lower()
+        return attempt < self.max_attempts and not any(p in msg for p in self.PERMANENT)
+
+    def ydl_params(self):
+        return {'retries': self.http_retries, 'fragment_retries': self.fragment_retries, 'file_access_retries': 3,
+                'retry_sleep_functions': {'http': self.delay, 'fragment': self.delay, 'file_access': lambda n: 1}}
+
+class JobJournal:
+    # Durable record of every queued job so a crash or restart can pick the queue back up.
+    # State changes are compare-and-set UPDATEs, each in its own transaction.
+    PENDING = ('queued', 'running', 'retrying')
+
+    def __init__(self, path=JOBS_DB):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, url TEXT, options TEXT, state TEXT, priority INTEGER DEFAULT 0, attempts INTEGER DEFAULT 0, partials TEXT DEFAULT '[]', error TEXT DEFAULT '', created REAL, updated REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state)")
+
+    def add(self, job_id, url, options, priority=0):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO jobs (id, url, options, state, priority, created, updated) VALUES (?, ?, ?, 'queued', ?, ?, ?)", (job_id, url, json.dumps(options), priority, now, now))
+
+    def transition(self, job_id, from_states, to_state, **fields):
+        sets, args = self._fields(fields)
+        marks = ", ".join("?" for _ in from_states)
+        with self.lock, self.db:
+            cur = self.db.execute(f"UPDATE jobs SET state = ?, updated = ?{sets} WHERE id = ? AND state IN ({marks})", [to_state, time.time()] + args + [job_id] + list(from_states))
+        return cur.rowcount == 1
+
+    def update(self, job_id, **fields):
+        sets, args = self._fields(fields)
+        with self.lock, self.db: self.db.execute(f"UPDATE jobs SET updated = ?{sets} WHERE id = ?", [time.time()] + args + [job_id])
+
+    def _fields(self, fields):
+        sets, args = "", []
+        for k in ('attempts', 'partials', 'error'):
+            if k in fields:
+                sets += f", {k} = ?"; args.append(json.dumps(fields[k]) if k == 'partials' else fields[k])
+        return sets, args
+
+    def pending(self):
+        # Jobs left 'running' by a crash go back to 'queued'; yt-dlp resumes from their .part files
+        with self.lock, self.db:
+            self.db.execute("UPDATE jobs SET state = 'queued' WHERE state IN ('running', 'retrying')")
+            rows = self.db.execute("SELECT * FROM jobs WHERE state = 'queued' ORDER BY priority DESC, created").fetchall()
+        return [dict(r, options=json.loads(r['options']), partials=json.loads(r['partials'])) for r in rows]
+
+    def is_active(self, url):
+        with self.lock:
+            return self.db.execute(f"SELECT 1 FROM jobs WHERE url = ? AND state IN ({', '.join('?' for _ in self.PENDING)}) LIMIT 1", [url] + list(self.PENDING)).fetchone() is not None
+
+    def prune(self, keep_seconds=7 * 86400):
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM jobs WHERE state NOT IN ({', '.join('?' for _ in self.PENDING)}) AND updated < ?", list(self.PENDING) + [time.time() - keep_seconds])
+
+    def close(self):
+        with self.lock: self.db.close()
+
+# ================= SCHEDULER =================
+class DownloadScheduler:
+    def __init__(self, max_workers=3, per_host=2, fragment_budget=32):
+        self.max_workers = max_workers; self.per_host = per_host; self.fragment_budget = fragment_budget
+        self.lock = threading.Lock()
+        self.queue = []
+        self.counter = itertools.count()
+        self.running = {}
+        self.host_counts = {}
+
+    def configure(self, max_workers=None, per_host=None, fragment_budget=None):
+        with self.lock:
+            if max_workers: self.max_workers = max(1, int(max_workers))
+            if per_host: self.per_host = max(1, int(per_host))
+            if fragment_budget: self.fragment_budget = max(1, int(fragment_budget))
+        self._dispatch()
+
+    def submit(self, engine, priority=0):
+        engine.scheduler = self; engine.state = 'queued'
+        with self.lock: heapq.heappush(self.queue, (-priority, next(self.counter), engine))
+        self._dispatch()
+
+    def reacquire(self, engine, priority=0):
+        # An engine that gave its slot back for post-processing and must download again queues like a new job;
+        # the returned event is set instead of starting the thread when its turn comes
+        engine.resume = threading.Event()
+        with self.lock: heapq.heappush(self.queue, (-priority, next(self.counter), engine))
+        self._dispatch()
+        return engine.resume
+
+    def holds(self, engine):
+        with self.lock: return engine in self.running
+
+    def cancel(self, engine):
+        engine.cancelled = True
+        with self.lock:
+            queued = [item for item in self.queue if item[2] is engine]
+            if queued:
+                self.queue.remove(queued[0]); heapq.heapify(self.queue)
+        # A waiting retry still has its thread, which reports the cancellation itself
+        if queued and not getattr(engine, 'resume', None):
+            engine.state = 'cancelled'
+            if engine.journal: engine.journal.transition(engine.task_id, ('queued',), 'cancelled')
+            engine.callbacks['finished'](engine.task_id, {}, False)
+
+    def release(self, engine):
+        with self.lock:
+            host = self.running.pop(engine, None)
+            if host is not None:
+                self.host_counts[host] -= 1
+                if self.host_counts[host] <= 0: del self.host_counts[host]
+        self._dispatch()
+
+    def fragments_for(self, engine):
+        with self.lock: return max(1, self.fragment_budget // max(1, len(self.running)))
+
+    def stats(self):
+        with self.lock:
+            return {'queued': len(self.queue), 'running': len(self.running), 'slots': self.max_workers, 'fragment_budget': self.fragment_budget, 'hosts': dict(self.host_counts)}
+
+    def _dispatch(self):
+        ready = []
+        with self.lock:
+            blocked = []
+            while self.queue and len(self.running) < self.max_workers:
+                item = heapq.heappop(self.queue)
+                engine = item[2]; host = host_key(engine.url)
+                if self.host_counts.get(host, 0) >= self.per_host:
+                    blocked.append(item); continue
+                self.running[engine] = host
+                self.host_counts[host] = self.host_counts.get(host, 0) + 1
+                engine.state = 'running'; ready.append(engine)
+            for item in blocked: heapq.heappush(self.queue, item)
+            running = list(self.running)
+        for engine in ready:
+            if getattr(engine, 'resume', None): engine.resume.set()
+            else: engine.start()
+        # Shares change whenever the running set does; the ones already running pick theirs up for the next download
+        for engine in running:
+            if engine not in ready: engine.refresh_fragments()
+
+class FragmentTuner:
+    # Learns concurrent_fragment_downloads per host: start small, double while throughput improves,
+    # settle below the first step that does not pay off, halve when throttled. Persisted to tuning.json.
+    def __init__(self, path=TUNING_FILE, initial=4, maximum=32, gain=0.1, min_bytes=2 * 1024 * 1024, reprobe=10, max_hosts=200):
+        self.path = path; self.initial = initial; self.maximum = maximum; self.gain = gain
+        self.min_bytes = min_bytes; self.reprobe = reprobe; self.max_hosts = max_hosts
+        self.lock = threading.Lock(); self.hosts = {}
+        try:
+            with open(path, 'r') as f: self.hosts = {h: s for h, s in json.load(f).items() if isinstance(s, dict)}
+        except: pass
+
+    def suggest(self, host):
+        with self.lock:
+            h = self.hosts.get(host)
+            return max(1, min(self.maximum, h['next'] if h else self.initial))
+
+    def report(self, host, n, nbytes, seconds):
+        # One finished fragmented download that ran with n fragments in flight
+        if nbytes < self.min_bytes or seconds <= 0 or n < 1: return
+        rate = nbytes / seconds
+        with self.lock:
+            h = self.hosts.setdefault(host, {'best': n, 'rate': 0.0, 'next': n, 'ceiling': 0, 'runs': 0})
+            if n == h['best'] or not h['rate']:
+                h['best'] = n; h['rate'] = rate if not h['rate'] else (h['rate'] + rate) / 2; h['runs'] += 1
+            elif rate > h['rate'] * (1 + self.gain):
+                h.update(best=n, rate=rate, runs=1)
+            elif n > h['best']: h['ceiling'] = n
+            # Re-try the ceiling now and then; links and CDNs change
+            if h['ceiling'] and h['runs'] >= self.reprobe: h['ceiling'] = 0; h['runs'] = 0
+            up = min(self.maximum, h['best'] * 2)
+            h['next'] = up if up > h['best'] and (not h['ceiling'] or up < h['ceiling']) else h['best']
+            h['updated'] = time.time()
+        self.save()
+
+    def penalize(self, host, n):
+        # Throttled (429/503, a rate-limit notice or a run of fragment errors): halve and do not climb past where it happened
+        with self.lock:
+            h = self.hosts.setdefault(host, {'best': n, 'rate': 0.0, 'next': n, 'ceiling': 0, 'runs': 0})
+            h.update(best=max(1, min(h['best'], n) // 2), rate=0.0, ceiling=max(1, n), runs=0, updated=time.time()); h['next'] = h['best']
         self.save()
 
-    def delete(self, index):
-        if 0 <= index < len(self.history):
-            delete_file(self.history[index]['path'])
-            del self.history[index]
-            self.save()
+    def stats(self):
+        with self.lock: return {host: {'fragments': h['next'], 'rate': int(h['rate'])} for host, h in self.hosts.items()}
 
     def save(self):
-        try:
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(self.history, f, indent=4)
+        with self.lock:
+            if len(self.hosts) > self.max_hosts:
+                for host in sorted(self.hosts, key=lambda k: self.hosts[k].get('updated', 0))[:len(self.hosts) - self.max_hosts]: del self.hosts[host]
+            data = json.loads(json.dumps(self.hosts))
+        try: write_json_atomic(self.path, data)
         except: pass
 
+# ================= BANDWIDTH =================
+def kbps(value):
+    # A hand-edited settings.json may hold "2MB" or null; None means the entry is ignored
+    try: return max(0, int(value or 0))
+    except (TypeError, ValueError): return None
+
+def rate_limits(settings):
+    # Settings keep KB/s (0 = unlimited); the scheduler works in bytes/s
+    windows = [w for w in settings.get("rate_schedule") or [] if isinstance(w, dict)]
+    schedule = [dict(w, limit=kbps(w.get('limit_kbps')) * 1024) for w in windows if kbps(w.get('limit_kbps')) is not None]
+    hosts = settings.get("host_rate_limits_kbps") or {}
+    hosts = {k: kbps(v) * 1024 for k, v in (hosts.items() if isinstance(hosts, dict) else ()) if kbps(v)}
+    return {'global_limit': (kbps(settings.get("rate_limit_kbps")) or 0) * 1024, 'host_limits': hosts, 'schedule': schedule}
+
+class TokenBucket:
+    def __init__(self, rate=0, burst=1.0):
+        self.rate = rate; self.burst = burst; self.tokens = 0.0; self.stamp = time.monotonic(); self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock: self.rate = rate; self.tokens = min(self.tokens, rate * self.burst)
+
+    def consume(self, n, now=None):
+        # Tokens may go negative; the debt is how long the caller has to sleep to stay at `rate`
+        with self.lock:
+            if not self.rate: return 0.0
+            now = time.monotonic() if now is None else now
+            self.tokens = min(self.rate * self.burst, self.tokens + max(0.0, now - self.stamp) * self.rate) - n; self.stamp = now
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class RateScheduler:
+    # Splits the bandwidth cap between jobs that are moving bytes: per-host caps first, then max-min fair share of the global cap
+    def __init__(self, global_limit=0, host_limits=None, schedule=None, recheck=30.0):
+        self.lock = threading.Lock()
+        self.engines = {}; self.buckets = {}; self.alloc = {}
+        self.recheck = recheck; self.checked = 0.0; self.applied = None
+        self.configure(global_limit, host_limits, schedule)
+
+    def configure(self, global_limit=0, host_limits=None, schedule=None):
+        with self.lock: self.global_limit = global_limit or 0; self.host_limits = host_limits or {}; self.schedule = schedule or []
+        self.rebalance()
+
+    def key(self, url): return host_key(url)
+
+    def limit_now(self, now=None):
+        # Time-of-day windows ("HH:MM"-"HH:MM", may wrap midnight) override the global cap
+        t = now or datetime.now(); minute = t.hour * 60 + t.minute
+        for w in self.schedule:
+            try: start, end = [int(h) * 60 + int(m) for h, m in (w['start'].split(":"), w['end'].split(":"))]
+            except: continue
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end): return w.get('limit', 0)
+        return self.global_limit
+
+    def register(self, engine):
+        with self.lock:
+            if engine in self.engines: return
+            self.engines[engine] = self.key(engine.url); self.buckets[engine] = TokenBucket()
+        self.rebalance()
+
+    def unregister(self, engine):
+        with self.lock:
+            if self.engines.pop(engine, None) is None: return
+            self.buckets.pop(engine, None); self.alloc.pop(engine, None)
+        self.rebalance()
+
+    def rebalance(self):
+        with self.lock:
+            limit = self.limit_now(); self.applied = limit; self.checked = time.monotonic()
+            groups = {}
+            for engine, key in self.engines.items(): groups.setdefault(key, []).append(engine)
+            caps = {e: (self.host_limits[key] / len(members) if self.host_limits.get(key) else math.inf) for key, members in groups.items() for e in members}
+            # Water-filling: the smallest caps are satisfied first, what they leave is shared by the rest
+            left, alloc = (limit or math.inf), {}
+            ordered = sorted(caps, key=caps.get)
+            for i, engine in enumerate(ordered):
+                share = min(caps[engine], left / (len(ordered) - i))
+                if share == math.inf: alloc[engine] = 0
+                else: alloc[engine] = max(1, int(share)); left -= share
+            self.alloc = alloc
+            for engine, rate in alloc.items(): self.buckets[engine].set_rate(rate)
+        for engine, rate in alloc.items(): engine.set_rate(rate)
+
+    def throttle(self, engine, nbytes):
+        if time.monotonic() - self.checked > self.recheck and self.limit_now() != self.applied: self.rebalance()
+        bucket = self.buckets.get(engine)
+        return bucket.consume(nbytes) if bucket else 0.0
+
+    def allocations(self):
+        with self.lock: return {engine.task_id: rate for engine, rate in self.alloc.items()}
+
+    def stats(self):
+        with self.lock: return {'limit': self.applied or 0, 'active': len(self.engines), 'allocated': sum(self.alloc.values())}
+
+# ================= POST-PROCESSING =================
+class PostProcessPool:
+    # CPU stage of the pipeline. Once a job's bytes have landed it gives its network slot back
+    # to the scheduler and waits here for one of cpu_count FFmpeg slots (merge, mp3, thumbnails).
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or os.cpu_count() or 2)
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.lock = threading.Lock()
+        self.waiting = set()
+        self.active = {}
+
+    def acquire(self, engine):
+        with self.lock: self.waiting.add(engine.task_id)
+        try:
+            while not self.slots.acquire(timeout=0.2):
+                if engine.cancelled: return False
+        finally:
+            with self.lock: self.waiting.discard(engine.task_id)
+        with self.lock: self.active[engine.task_id] = ""
+        return True
+
+    def progress(self, engine, step):
+        with self.lock:
+            if engine.task_id in self.active: self.active[engine.task_id] = step
+
+    def release(self, engine):
+        with self.lock:
+            if self.active.pop(engine.task_id, None) is None: return
+        self.slots.release()
+
+    def stats(self):
+        with self.lock: return {'workers': self.workers, 'queued': len(self.waiting), 'running': len(self.active), 'steps': dict(self.active)}
+
+# ================= METRICS =================
+# Throttling is a 429/503 (on a fragment or as the final error) or yt-dlp saying so. A single 403 is usually
+# geo/auth and not a concurrency problem, but a run of fragment errors of any kind also counts as throttling.
+THROTTLE_RE = re.compile(r"HTTP Error (?:429|503)\b|\brate[- ]limited\b", re.IGNORECASE)
+FRAGMENT_ERROR_RE = re.compile(r"Got error:.*fragment|Skipping fragment|fragment \d+ not found", re.IGNORECASE)
+FRAGMENT_ERROR_RUN = 5
+
+class JobMetrics:
+    # One record per job: phase timings of the last attempt plus counters over all attempts
+    PHASES = ("extract", "transfer", "postprocess")
+
+    def __init__(self, engine):
+        self.created = engine.created; self.marks = {}; self.lock = threading.Lock()
+        self.data = {'task': engine.task_id, 'platform': detect_platform(engine.url), 'host': url_host(engine.url), 'mode': engine.options.get('mode', 'normal'),
+                     'queued_s': round(time.monotonic() - engine.created, 3), 'extract_s': None, 'ttfb_s': None, 'transfer_s': None, 'postprocess_s': None, 'total_s': None,
+                     'bytes': 0, 'speed_bps': None, 'cache_hit': False, 'retries': 0, 'http_errors': 0, 'fragment_errors': 0, 'warnings': 0,
+                     'ok': None, 'error': None, 'last_warning': None, 'date': get_timestamp()}
+
+    def begin_attempt(self):
+        with self.lock:
+            self.marks = {}; self.data['bytes'] = 0
+            for phase in self.PHASES: self.data[f"{phase}_s"] = None
+            self.data['ttfb_s'] = None
+
+    def start(self, phase):
+        with self.lock: self.marks.setdefault(phase, time.monotonic())
+
+    def stop(self, phase):
+        with self.lock:
+            if phase in self.marks: self.data[f"{phase}_s"] = round(time.monotonic() - self.marks[phase], 3)
+
+    def first_byte(self):
+        with self.lock:
+            if self.data['ttfb_s'] is None and 'transfer' in self.marks: self.data['ttfb_s'] = round(time.monotonic() - self.marks['transfer'], 3)
+
+    def add_bytes(self, n):
+        with self.lock: self.data['bytes'] += n or 0
+
+    def note(self, msg, warning=False):
+        # yt-dlp routes retry chatter through logger.debug/warning ("[download] Got error: ... Retrying fragment 3 (1/10)...")
+        with self.lock:
+            if FRAGMENT_ERROR_RE.search(msg): self.data['fragment_errors'] += 1
+            elif "Got error:" in msg: self.data['http_errors'] += 1
+            if warning: self.data['warnings'] += 1; self.data['last_warning'] = clean_text(msg)[:200]
+
+    def finish(self, ok, error=None, **fields):
+        with self.lock:
+            self.data.update(fields, ok=ok, error=clean_text(str(error))[:300] if error else None, total_s=round(time.monotonic() - self.created, 3))
+            if self.data['bytes'] and self.data['transfer_s']: self.data['speed_bps'] = int(self.data['bytes'] / max(self.data['transfer_s'], 0.001))
+            return dict(self.data)
+
+class MetricsRecorder:
+    # Finished jobs go to a rotating JSON-lines file and into per-platform rolling windows for p50/p95
+    SERIES = ("queued_s", "extract_s", "ttfb_s", "transfer_s", "postprocess_s", "total_s", "speed_bps")
+
+    def __init__(self, path=METRICS_FILE, max_bytes=5 * 1024 * 1024, backups=3, window=500):
+        self.path = path; self.max_bytes = max_bytes; self.backups = backups; self.window = window
+        self.lock = threading.Lock(); self.log = None
+        self.samples = {}; self.counts = {}
+
+    def writer(self):
+        if self.log is None:
+            import logging, logging.handlers
+            log = logging.getLogger(f"onyx.metrics.{id(self)}"); log.setLevel(logging.INFO); log.propagate = False
+            handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s")); log.addHandler(handler); self.log = log
+        return self.log
+
+    def record(self, data):
+        with self.lock:
+            series = self.samples.setdefault(data['platform'], {k: [] for k in self.SERIES})
+            for k in self.SERIES:
+                if data.get(k) is not None:
+                    series[k].append(data[k])
+                    if len(series[k]) > self.window: del series[k][0]
+            count = self.counts.setdefault(data['platform'], {'jobs': 0, 'failed': 0, 'retries': 0, 'fragment_errors': 0})
+            count['jobs'] += 1; count['failed'] += 0 if data.get('ok') else 1
+            count['retries'] += data.get('retries', 0); count['fragment_errors'] += data.get('fragment_errors', 0)
+            try: self.writer().info(json.dumps(data))
+            except Exception: pass
+
+    def summary(self):
+        with self.lock:
+            out = {}
+            for name, series in self.samples.items():
+                out[name] = dict(self.counts[name])
+                for k, values in series.items():
+                    if values: ordered = sorted(values); out[name][k] = {'p50': percentile(ordered, 50), 'p95': percentile(ordered, 95)}
+            return out
+
+def percentile(ordered, pct):
+    # Nearest-rank on an already sorted list
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+class JobProfiler:
+    # Opt-in per job: "cpu" runs cProfile on the engine thread, "memory" traces allocations (process-wide) while the job runs
+    active_traces = 0; trace_lock = threading.Lock()
+
+    def __init__(self, kind, task_id, directory=PROFILE_DIR):
+        self.kind = kind; self.path = os.path.join(directory, f"{clean_filename(str(task_id))}.{'prof' if kind == 'cpu' else 'txt'}"); self.profile = None
+
+    def start(self):
+        if self.kind == "cpu":
+            import cProfile
+            self.profile = cProfile.Profile(); self.profile.enable()
+        elif self.kind == "memory":
+            import tracemalloc
+            with JobProfiler.trace_lock:
+                if not JobProfiler.active_traces: tracemalloc.start(); tracemalloc.reset_peak()
+                JobProfiler.active_traces += 1
+
+    def stop(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.kind == "cpu" and self.profile:
+            self.profile.disable(); self.profile.dump_stats(self.path)
+            return {'profile': self.path}
+        if self.kind == "memory":
+            import tracemalloc
+            with JobProfiler.trace_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:25]
+                JobProfiler.active_traces -= 1
+                if not JobProfiler.active_traces: tracemalloc.stop()
+            with open(self.path, 'w') as f: f.write("\n".join(str(s) for s in top))
+            return {'profile': self.path, 'mem_peak': peak}
+        return {}
+
+# ================= DISK =================
+_libc = None
+
+def preallocate(path, size):
+    # Allocate blocks up front (less fragmentation, disk full at the start instead of mid-file) without changing
+    # the length: yt-dlp resumes from the current size. Windows: FileAllocationInfo, which NTFS keeps until the
+    # last handle (the downloader's) closes. Linux: fallocate(KEEP_SIZE). Elsewhere a no-op
+    global _libc
+    if size <= 0: return False
+    try:
+        if os.name == 'nt': return preallocate_windows(path, size)
+        if not sys.platform.startswith('linux'): return False
+        if _libc is None:
+            import ctypes, ctypes.util
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+        fd = os.open(path, os.O_WRONLY)
+        try: return _libc.fallocate(fd, 1, 0, size) == 0  # FALLOC_FL_KEEP_SIZE
+        finally: os.close(fd)
+    except Exception: return False
+
+def preallocate_windows(path, size):
+    import ctypes, msvcrt
+    set_info = ctypes.windll.kernel32.SetFileInformationByHandle
+    set_info.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_ulong]
+    fd = os.open(path, os.O_WRONLY | os.O_BINARY)
+    try:
+        allocation = ctypes.c_longlong(size)  # FILE_ALLOCATION_INFO
+        return bool(set_info(msvcrt.get_osfhandle(fd), 5, ctypes.byref(allocation), ctypes.sizeof(allocation)))  # FileAllocationInfo
+    finally: os.close(fd)
+
+def estimate_size(info):
+    # Selected formats only; streams without a size fall back to bitrate x duration
+    formats = info.get('requested_formats') or [info]
+    duration = info.get('duration') or 0
+    return int(sum(f.get('filesize') or f.get('filesize_approx') or (f.get('tbr') or 0) * 125 * duration for f in formats))
+
+class DiskReservations:
+    # Space promised to running jobs per volume: parallel jobs must not each pass a free-space check they jointly fail
+    def __init__(self, margin=512 * 1024 * 1024):
+        self.margin = margin; self.lock = threading.Lock(); self.jobs = {}  # owner -> [volume, reserved, written]
+
+    def volume(self, path):
+        try: return os.stat(path).st_dev
+        except OSError: return os.path.splitdrive(os.path.abspath(path))[0]
+
+    def reserve(self, owner, path, nbytes):
+        import shutil
+        os.makedirs(path, exist_ok=True)
+        free, volume = shutil.disk_usage(path).free, self.volume(path)
+        with self.lock:
+            # Bytes other jobs already wrote are gone from `free`; only what they still need is held back
+            pending = sum(max(0, r - w) for o, (v, r, w) in self.jobs.items() if v == volume and o is not owner)
+            available = max(0, free - pending - self.margin)
+            if nbytes > available: return False, available
+            self.jobs[owner] = [volume, nbytes, 0]
+        return True, available
+
+    def written(self, owner, nbytes):
+        with self.lock:
+            if owner in self.jobs: self.jobs[owner][2] = nbytes
+
+    def release(self, owner):
+        with self.lock: self.jobs.pop(owner, None)
+
+    def stats(self):
+        with self.lock: return {'jobs': len(self.jobs), 'reserved': sum(max(0, r - w) for v, r, w in self.jobs.values())}
+
+class OutputIndex:
+    # Directory listings kept in memory so picking a free output name is a set lookup, not os.path.exists per try.
+    # A folder is listed again once its listing is `rescan` seconds old and its mtime moved (files added outside the app)
+    def __init__(self, rescan=60.0):
+        self.rescan = rescan; self.lock = threading.Lock(); self.dirs = {}; self.claims = {}
+
+    def names(self, directory):
+        key = os.path.normcase(os.path.abspath(directory)); entry = self.dirs.get(key); now = time.monotonic()
+        if entry and now - entry['scanned'] < self.rescan: return entry['names']
+        try: mtime = os.stat(directory).st_mtime_ns
+        except OSError: mtime = None
+        if entry and entry['mtime'] == mtime: entry['scanned'] = now; return entry['names']
+        names = set()
+        try:
+            with os.scandir(directory) as it: names = {os.path.normcase(e.name) for e in it}
+        except OSError: pass
+        names |= {os.path.basename(p) for p, o in self.claims.items() if os.path.dirname(p) == key}
+        self.dirs[key] = {'names': names, 'scanned': now, 'mtime': mtime}
+        return names
+
+    def claim(self, path, owner, also=()):
+        # Returns `path`, or "name (2).ext", "name (3).ext", ... if another file or job already has it.
+        # also: other extensions the output may end up with; the same stem must be free for those too
+        directory, base = os.path.split(path); stem, ext = os.path.splitext(base); key = os.path.normcase(os.path.abspath(directory))
+        with self.lock:
+            names = self.names(directory); candidate, n = stem, 2
+            def taken(name): return os.path.normcase(name) in names and self.claims.get(os.path.join(key, os.path.normcase(name))) is not owner
+            while any(taken(candidate + e) for e in (ext,) + tuple(also)): candidate = f"{stem} ({n})"; n += 1
+            for e in (ext,) + tuple(also):
+                names.add(os.path.normcase(candidate + e)); self.claims[os.path.join(key, os.path.normcase(candidate + e))] = owner
+        return os.path.join(directory, candidate + ext)
+
+    def add(self, path):
+        with self.lock: self.names(os.path.dirname(path)).add(os.path.normcase(os.path.basename(path)))
+
+    def release(self, owner, keep=True):
+        # keep: the claimed file now exists; otherwise the name is free again
+        with self.lock:
+            for p in [p for p, o in self.claims.items() if o is owner]:
+                del self.claims[p]
+                entry = self.dirs.get(os.path.dirname(p))
+                if not keep and entry: entry['names'].discard(os.path.basename(p))
+
 # ================= ENGINE =================
 class DownloaderEngine(threading.Thread):
-    def __init__(self, task_id, url, options, callbacks):
+    def __init__(self, task_id, url, options, callbacks, cache=None, progress=None, journal=None, retry=None, pp_pool=None, history=None, rates=None, metrics=None, tuner=None, disk=None, outputs=None):
         super().__init__()
-        self.task_id = task_id; self.url = url; self.options = options; self.callbacks = callbacks; self.cancelled = False 
-    
+        self.disk = disk; self.outputs = outputs; self.estimate = 0; self.allocated = set()
+        self.history = history; self.rates = rates; self.rate = 0; self.ydl = None; self.seen_bytes = {}
+        self.metrics = metrics; self.record = None; self.created = time.monotonic()
+        self.tuner = tuner; self.host = host_key(url); self.fragments_used = {}; self.throttled = False; self.fragment_errors = 0
+        self.cache = cache; self.progress = progress; self.journal = journal; self.retry = retry or RetryPolicy(); self.pp_pool = pp_pool
+        self.bytes_landed = False; self.pp_stage = False
+        self.task_id = task_id; self.url = url; self.options = options; self.callbacks = callbacks; self.cancelled = False
+        self.scheduler = None; self.resume = None; self.state = 'queued'; self.final_path = None; self.last_error = None; self.partials = set()
+
     def run(self):
+        self.record = JobMetrics(self)
+        profiler = JobProfiler(self.options['profile'], self.task_id) if self.options.get('profile') else None
+        if profiler: profiler.start()
+        res, error = {}, None
+        try:
+            if 'state' in self.callbacks: self.callbacks['state'](self.task_id, 'running')
+            if self.journal: self.journal.transition(self.task_id, ('queued', 'retrying'), 'running')
+            attempt = 0
+            while True:
+                try:
+                    res = self._run(); break
+                except Exception as e:
+                    self.leave_postprocessing()
+                    if self.cancelled or not self.retry.should_retry(attempt, e): raise
+                    delay = self.retry.delay(attempt); attempt += 1; self.record.data['retries'] = attempt
+                    if self.journal: self.journal.transition(self.task_id, ('running',), 'retrying', attempts=attempt, error=str(e))
+                    self.callbacks['log'](self.task_id, f"Retrying in {int(delay)}s ({attempt}/{self.retry.max_attempts}): {str(e)[:30]}")
+                    if not self.wait(delay): raise
+                    if self.scheduler and not self.scheduler.holds(self): self.requeue()
+                    if self.journal: self.journal.transition(self.task_id, ('retrying',), 'running')
+            if self.journal: self.journal.transition(self.task_id, ('running',), 'done', partials=[])
+            self.callbacks['finished'](self.task_id, res, True)
+        except Exception as e:
+            error = e
+            if self.journal: self.journal.transition(self.task_id, ('running', 'retrying'), 'cancelled' if self.cancelled else 'failed', error=str(e))
+            self.callbacks['finished'](self.task_id, {}, False)
+        finally:
+            self.leave_postprocessing()
+            if self.rates: self.rates.unregister(self)
+            if self.disk: self.disk.release(self)
+            if self.outputs:
+                self.outputs.release(self, keep=error is None)
+                if res.get('path'): self.outputs.add(res['path'])
+            self.state = 'done'; self.ydl = None
+            extra = profiler.stop() if profiler else {}
+            data = self.record.finish(error is None, "Cancelled" if self.cancelled and error else error, cancelled=self.cancelled, playlist=bool(res.get('playlist')), duplicate=res.get('duplicate'), **extra)
+            if self.metrics: self.metrics.record(data)
+            if self.scheduler: self.scheduler.release(self)
+
+    def requeue(self):
+        # The slot went back at post-processing (or playlist listing); a retry downloads again, so wait for one
+        ready = self.scheduler.reacquire(self)
+        while not ready.wait(0.2):
+            if self.cancelled: self.scheduler.cancel(self); raise Exception("Cancelled")
+        self.resume = None
+        if self.cancelled: raise Exception("Cancelled")
+
+    def fan_out(self, info):
+        # Each entry becomes its own task as soon as it is listed; enumeration itself is only a
+        # few page requests, so it does not hold on to a download slot
+        if self.scheduler: self.scheduler.release(self)
+        title = info.get('title') or 'Playlist'; queued = skipped = 0
+        self.callbacks['log'](self.task_id, f"Playlist: {title}")
+        for entry in iter_entries(info.get('entries')):
+            if self.cancelled: raise Exception("Cancelled")
+            url = (entry or {}).get('webpage_url') or (entry or {}).get('url') or ""
+            if not url.startswith("http"): continue
+            if self.duplicate_of(url, entry.get('ie_key') or "", str(entry.get('id') or "")): skipped += 1; continue
+            self.callbacks['entry'](self.task_id, url, entry.get('title') or url); queued += 1
+            if queued % 10 == 0: self.callbacks['log'](self.task_id, f"Playlist: {title} ({queued} queued, {skipped} skipped)")
+        self.callbacks['log'](self.task_id, f"Playlist: {title} ({queued} queued, {skipped} skipped)")
+        return {'title': title, 'url': self.url, 'platform': detect_platform(self.url), 'playlist': True, 'entries': queued, 'skipped': skipped}
+
+    def duplicate_of(self, url, extractor="", video_id=""):
+        if not self.history or self.options.get('dedup_policy', 'skip') == 'force' or self.options.get('mode') == 'thumbnail': return None
+        # An mp3 from "Audio Only" does not satisfy a video request and vice versa
+        audio = self.options.get('format') == "Audio Only"
+        return next((r for r in self.history.find_duplicates(url, extractor, video_id) if r['path'].lower().endswith('.mp3') == audio), None)
+
+    def reuse(self, dup):
+        # skip: report the existing file and record nothing; relink: record it again as this job's result
+        self.callbacks['log'](self.task_id, f"Already downloaded: {dup['title']}")
+        res = {k: dup[k] for k in HistoryManager.COLUMNS if k != 'url_key'}
+        res.update(url=self.url, date=get_timestamp(), duplicate=self.options.get('dedup_policy', 'skip'))
+        return res
+
+    def wait(self, seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            if self.cancelled: return False
+            time.sleep(min(0.2, max(0.0, end - time.monotonic())))
+        return not self.cancelled
+
+    def fragment_count(self):
+        n = self.scheduler.fragments_for(self) if self.scheduler else 16
+        # The learned per-host value, never more than this job's share of the fragment budget
+        if self.tuner: n = min(n, self.tuner.suggest(self.host))
+        # A capped job gains nothing from more connections than its share can feed (~512 KB/s each)
+        return max(1, min(n, self.rate // (512 * 1024))) if self.rate else n
+
+    def set_rate(self, rate):
+        # Called by RateScheduler on rebalance; yt-dlp reads these params afresh for every download/fragment
+        self.rate = rate
+        if self.ydl: self.ydl.params.update({'ratelimit': rate or None, 'concurrent_fragment_downloads': self.fragment_count()})
+
+    def refresh_fragments(self):
+        if self.ydl: self.ydl.params['concurrent_fragment_downloads'] = self.fragment_count()
+
+    def preflight(self, ydl, info):
+        # Select formats on a copy (nothing is downloaded) to learn the size and final name before any bytes move
+        try: selected = ydl.process_ie_result(copy.deepcopy(info), download=False) or {}
+        except Exception: return  # format errors surface in the real run
+        if self.disk: self.disk.release(self)
+        self.estimate = estimate_size(selected)
+        audio = self.options.get('format') == "Audio Only"
+        if self.disk and self.estimate:
+            # Merging / extracting audio writes the output next to its inputs before they are deleted
+            need = self.estimate * (2 if audio or len(selected.get('requested_formats') or ()) > 1 else 1)
+            ok, free = self.disk.reserve(self, self.options['download_path'], need)
+            if not ok:
+                msg = f"Not enough disk space: needs ~{format_size(need)}, {format_size(free)} free"
+                self.callbacks['log'](self.task_id, msg); raise Exception(msg)
+        if self.outputs:
+            path = ydl.prepare_filename(selected)
+            if audio: path = os.path.splitext(path)[0] + '.mp3'
+            unique = self.outputs.claim(path, self)
+            if unique != path:
+                self.callbacks['log'](self.task_id, f"Saving as {os.path.basename(unique)}")
+                stem = os.path.splitext(unique)[0].replace('%', '%%')
+                ydl.params['outtmpl']['default'] = stem + '.%(ext)s'
+
+    def _run(self):
+        import yt_dlp
         save_path = self.options['download_path']
         mode = self.options.get('mode', 'normal')
         ydl_opts = {
             'outtmpl': os.path.join(save_path, '%(title)s.%(ext)s'),
             'progress_hooks': [self.hook],
+            'postprocessor_hooks': [self.pp_hook],
             'logger': self,
-            'ignoreerrors': True, 'no_warnings': True, 'quiet': True, 'nocolor': True, 'retries': 30,
+            # Playlists/channels: list entries without resolving each one, page by page
+            'extract_flat': 'in_playlist' if 'entry' in self.callbacks else False, 'lazy_playlist': True,
+            'ignoreerrors': True, 'no_warnings': True, 'quiet': True, 'nocolor': True, 'continuedl': True,
             'ffmpeg_location': FFMPEG_EXE if os.path.exists(FFMPEG_EXE) else None
         }
         
         if mode == 'thumbnail':
-            ydl_opts.update({'skip_download': True, 'writethumbnail': True, 'convert_thumbnails': 'jpg', 'outtmpl': os.path.join(save_path, '%(title)s')})
+            ydl_opts.update({'skip_download': True, 'writethumbnail': True, 'convert_thumbnails': 'jpg', 'ignore_no_formats_error': True, 'outtmpl': os.path.join(save_path, '%(title)s')})
         else:
-            ydl_opts.update({'writethumbnail': self.options.get('save_thumbnail', False), 'writesubtitles': self.options.get('embed_subs', False), 'concurrent_fragment_downloads': 16})
+            ydl_opts.update({'writethumbnail': self.options.get('save_thumbnail', False), 'writesubtitles': self.options.get('embed_subs', False), 'concurrent_fragment_downloads': self.fragment_count()})
             if self.options['format'] == "Audio Only":
                 ydl_opts['format'] = 'bestaudio/best'; ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio','preferredcodec': 'mp3'}]
             else:
@@ -239,39 +1557,395 @@ class DownloaderEngine(threading.Thread):
                 elif res == '4K': ydl_opts['format'] = 'bestvideo[height>=2160]+bestaudio/bestvideo[height>=1440]+bestaudio/best'
                 elif res == '1080p': ydl_opts['format'] = 'bestvideo[height=1080]+bestaudio/bestvideo[height>=1080]+bestaudio/best'
                 elif res == '720p': ydl_opts['format'] = 'bestvideo[height=720]+bestaudio/bestvideo[height>=720]+bestaudio/best'
+                elif res == '480p': ydl_opts['format'] = 'bestvideo[height=480]+bestaudio/bestvideo[height>=480]+bestaudio/best'
                 ydl_opts['merge_output_format'] = 'mp4'
 
+        ydl_opts.update(self.retry.ydl_params())
+        self.final_path = None; self.last_error = None; self.bytes_landed = False; self.fragments_used = {}; self.throttled = False; self.fragment_errors = 0
         if self.options.get('proxy'): ydl_opts['proxy'] = self.options.get('proxy')
         if self.options.get('cookies_path'): ydl_opts['cookiefile'] = self.options.get('cookies_path')
 
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(self.url, download=False)
-                title = info.get('title', 'Unknown Media')
-                self.callbacks['log'](self.task_id, f"Found: {title}")
-                if self.cancelled: raise Exception("Cancelled")
-                ydl.download([self.url])
-                
-                if mode == 'thumbnail': fpath = os.path.join(save_path, f"{clean_filename(title)}.jpg")
-                else:
-                    fpath = ydl.prepare_filename(info)
-                    if self.options['format'] == "Audio Only": fpath = os.path.splitext(fpath)[0] + ".mp3"
-                
-                if not self.cancelled: self.callbacks['finished'](self.task_id, {'title': title, 'platform': detect_platform(self.url), 'size': format_size(info.get('filesize', 0)), 'path': fpath, 'date': get_timestamp()}, True)
-                else: self.callbacks['finished'](self.task_id, {}, False)
-        except: 
-            if not self.cancelled: self.callbacks['finished'](self.task_id, {}, False)
+        # Fast path: the URL alone already identifies media we have on disk
+        self.record.begin_attempt(); self.record.start('extract')
+        dup = self.duplicate_of(self.url, *url_media_id(self.url)) if self.history else None
+        if dup: return self.reuse(dup)
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            self.ydl = ydl
+            # Extract once (unprocessed) and download from that same info dict
+            info = self.cache.get(self.url, self.options, need_formats=mode != 'thumbnail') if self.cache else None
+            self.record.data['cache_hit'] = info is not None
+            if info is None:
+                info = ydl.extract_info(self.url, download=False, process=False)
+                while info and info.get('_type') == 'url':
+                    info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+                if info is None: raise Exception(self.last_error or "Extraction failed")
+                if info.get('_type') in ('playlist', 'multi_video') and 'entry' in self.callbacks: return self.fan_out(info)
+                if self.cache: self.cache.put(self.url, self.options, info)
+            extractor, video_id = info.get('extractor_key') or "", str(info.get('id') or "")
+            dup = self.duplicate_of(info.get('webpage_url') or self.url, extractor, video_id)
+            if dup: return self.reuse(dup)
+            self.record.stop('extract')
+            title = info.get('title') or 'Unknown Media'
+            self.callbacks['log'](self.task_id, f"Found: {title}")
+            if mode != 'thumbnail': self.preflight(ydl, info)
+            if self.cancelled: raise Exception("Cancelled")
+            self.record.start('transfer')
+            result = ydl.process_ie_result(info, download=True) or info
+            # ignoreerrors turns download failures into logger errors instead of exceptions
+            if self.last_error or self.cancelled: raise Exception(self.last_error or "Cancelled")
+            title = result.get('title') or title
+            fpath = self.final_path or self.result_path(result)
+            digest = file_sha256(fpath) if self.options.get('dedup_hash') and fpath and os.path.isfile(fpath) else ""
+            self.record.stop('postprocess')
+            return {'title': title, 'url': self.url, 'platform': detect_platform(self.url), 'size': format_size(os.path.getsize(fpath) if fpath and os.path.isfile(fpath) else self.estimate), 'path': fpath, 'date': get_timestamp(),
+                    'extractor': extractor, 'video_id': video_id, 'content_hash': digest}
 
     def hook(self, d):
         if self.cancelled: raise Exception("Cancelled")
+        if d.get('tmpfilename') and d['tmpfilename'] not in self.partials:
+            self.partials.add(d['tmpfilename'])
+            if self.journal: self.journal.update(self.task_id, partials=sorted(self.partials))
+        if d['status'] == 'finished':
+            self.bytes_landed = True; self.record.stop('transfer'); self.record.add_bytes(d.get('total_bytes') or d.get('downloaded_bytes'))
+            if self.tuner: self.tune(d)
         if d['status'] == 'downloading':
+            if 'fragment_index' in d and self.ydl: self.fragments_used.setdefault(d.get('filename', ''), self.ydl.params.get('concurrent_fragment_downloads') or 1)
             total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
             downloaded = d.get('downloaded_bytes', 0)
-            p = (downloaded / total * 100) if total > 0 else 0
-            self.callbacks['progress'](self.task_id, int(p), clean_text(d.get('_speed_str', 'N/A')))
+            if downloaded: self.record.first_byte()
+            if d.get('tmpfilename') and d['tmpfilename'] not in self.allocated:
+                # Only exact sizes: blocks reserved past an estimate would stay allocated after the rename
+                self.allocated.add(d['tmpfilename'])
+                if d.get('total_bytes') and self.options.get('preallocate', True): preallocate(d['tmpfilename'], d['total_bytes'])
+            if self.disk: self.disk.written(self, self.record.data['bytes'] + downloaded)
+            if self.rates: self.throttle(d.get('filename', ''), downloaded)
+            if self.progress: self.progress.update(self.task_id, d.get('filename', ''), downloaded, total)
+            elif 'progress' in self.callbacks:
+                p = (downloaded / total * 100) if total > 0 else 0
+                self.callbacks['progress'](self.task_id, int(p), clean_text(d.get('_speed_str', 'N/A')))
+
+    def throttle(self, filename, downloaded):
+        # ratelimit only holds each connection back; the bucket caps the sum over concurrent fragments
+        self.rates.register(self)
+        delta = downloaded - self.seen_bytes.get(filename, 0); self.seen_bytes[filename] = downloaded
+        delay = self.rates.throttle(self, delta) if delta > 0 else 0
+        if delay > 0 and not self.wait(min(delay, 5.0)): raise Exception("Cancelled")
+
+    def tune(self, d):
+        # Feed the finished fragmented download back and use the new value for the next one (e.g. the audio stream)
+        n = self.fragments_used.pop(d.get('filename', ''), None)
+        if n and not self.throttled and d.get('elapsed'): self.tuner.report(self.host, n, d.get('total_bytes') or d.get('downloaded_bytes') or 0, d['elapsed'])
+        self.refresh_fragments()
+
+    def note(self, msg, warning=False):
+        self.record.note(msg, warning)
+        if not self.tuner or self.throttled: return
+        if FRAGMENT_ERROR_RE.search(msg): self.fragment_errors += 1
+        if THROTTLE_RE.search(msg) or self.fragment_errors >= FRAGMENT_ERROR_RUN:
+            self.throttled = True; self.tuner.penalize(self.host, (self.ydl.params.get('concurrent_fragment_downloads') if self.ydl else 0) or self.fragment_count())
+            self.refresh_fragments()
+
+    def pp_hook(self, d):
+        if d['status'] == 'started': self.enter_postprocessing(d.get('postprocessor', ""))
+        # Post-processors report the real path (merged mp4, extracted mp3, converted jpg)
+        if d['status'] != 'finished': return
+        info = d.get('info_dict') or {}
+        if self.options.get('mode') == 'thumbnail':
+            thumbs = [t['filepath'] for t in info.get('thumbnails') or [] if t.get('filepath')]
+            if thumbs: self.final_path = thumbs[-1]
+        elif info.get('filepath'): self.final_path = info['filepath']
+
+    def enter_postprocessing(self, step):
+        if self.cancelled: raise Exception("Cancelled")
+        if self.pp_stage:
+            if self.pp_pool: self.pp_pool.progress(self, step)
+            return
+        if not self.bytes_landed and self.options.get('mode') != 'thumbnail': return
+        # Network work is over: free the download slot and bandwidth share before queueing for CPU
+        self.pp_stage = True; self.record.start('postprocess')
+        if self.scheduler: self.scheduler.release(self)
+        if self.rates: self.rates.unregister(self)
+        if self.pp_pool:
+            if 'state' in self.callbacks: self.callbacks['state'](self.task_id, 'waiting_cpu')
+            if not self.pp_pool.acquire(self): raise Exception("Cancelled")
+            self.pp_pool.progress(self, step)
+        if 'state' in self.callbacks: self.callbacks['state'](self.task_id, 'postprocessing')
+
+    def leave_postprocessing(self):
+        if self.pp_stage and self.pp_pool: self.pp_pool.release(self)
+        self.pp_stage = False
+
+    def result_path(self, result):
+        if self.options.get('mode') == 'thumbnail':
+            thumbs = [t['filepath'] for t in result.get('thumbnails') or [] if t.get('filepath')]
+            return thumbs[-1] if thumbs else ""
+        downloads = result.get('requested_downloads') or [{}]
+        return downloads[-1].get('filepath') or result.get('filepath') or ""
+
+    def debug(self, msg): self.note(msg)
+    def info(self, msg): pass
+    def warning(self, msg): self.note(msg, warning=True)
+    def error(self, msg): self.note(msg); self.last_error = clean_text(msg).replace("ERROR: ", "", 1)
+
+def clean_filename(s): return "".join([c for c in s if c.isalpha() or c.isdigit() or c in " .-_"]).rstrip()
+
+# ================= THUMBNAILS =================
+JPEG_MAGIC = b"\xff\xd8\xff"
+IMAGE_EXTS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif", "image/avif": "avif"}
+
+def best_thumbnail_order(thumbnails):
+    # Best first by yt-dlp preference, then pixel count; JPEG wins ties so it can be kept as-is
+    def rank(t):
+        is_jpeg = (t.get('url') or "").split("?")[0].lower().endswith((".jpg", ".jpeg"))
+        return (t.get('preference') or 0, (t.get('width') or 0) * (t.get('height') or 0), is_jpeg)
+    ordered = [t for t in thumbnails or [] if (t.get('url') or "").startswith("http")]
+    # Without dimensions or preference yt-dlp lists thumbnails worst to best
+    return [t for _, t in sorted(enumerate(ordered), key=lambda it: (rank(it[1]), it[0]), reverse=True)]
+
+class ThumbnailBatch:
+    # Cover art for many links or whole playlists: one flat extraction pass, then parallel image fetches
+    # over a single pooled session; only non-JPEG sources go through FFmpeg.
+    def __init__(self, download_path, workers=8, proxy="", cookies_path="", candidates=3, timeout=20, outputs=None):
+        self.download_path = download_path; self.workers = workers; self.proxy = proxy; self.cookies_path = cookies_path
+        self.candidates = candidates; self.timeout = timeout; self.outputs = outputs or OutputIndex()
+        self.cancelled = False; self.last_error = None
+
+    def session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers, max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)))
+        s.mount("https://", adapter); s.mount("http://", adapter)
+        if self.proxy: s.proxies = {'http': self.proxy, 'https': self.proxy}
+        if self.cookies_path and os.path.exists(self.cookies_path):
+            from http.cookiejar import MozillaCookieJar
+            jar = MozillaCookieJar(self.cookies_path)
+            try: jar.load(ignore_discard=True, ignore_expires=True); s.cookies.update(jar)
+            except: pass
+        return s
+
+    def items(self, urls):
+        # (source url, title, thumbnails) per video; playlists are listed flat, entries without thumbnails resolved one by one
+        import yt_dlp
+        opts = {'extract_flat': 'in_playlist', 'lazy_playlist': True, 'ignoreerrors': True, 'quiet': True, 'no_warnings': True, 'logger': self, 'skip_download': True}
+        if self.proxy: opts['proxy'] = self.proxy
+        if self.cookies_path: opts['cookiefile'] = self.cookies_path
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            pending = list(urls)
+            while pending and not self.cancelled:
+                url = pending.pop(0); info = ydl.extract_info(url, download=False, process=False)
+                while info and info.get('_type') == 'url' and not info.get('thumbnails'):
+                    info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+                if not info: yield url, url, [], self.last_error or "Extraction failed"; continue
+                if info.get('_type') in ('playlist', 'multi_video'):
+                    for entry in iter_entries(info.get('entries')):
+                        if self.cancelled: return
+                        if not entry: continue
+                        link = entry.get('webpage_url') or entry.get('url') or ""
+                        if entry.get('thumbnails') or entry.get('thumbnail'): yield link, entry.get('title') or link, entry.get('thumbnails') or [{'url': entry['thumbnail']}], None
+                        elif link.startswith("http"): pending.insert(0, link)
+                    continue
+                thumbs = info.get('thumbnails') or ([{'url': info['thumbnail']}] if info.get('thumbnail') else [])
+                yield info.get('webpage_url') or url, info.get('title') or url, thumbs, None if thumbs else "No thumbnail"
+
+    def run(self, urls, on_item=None):
+        from concurrent.futures import ThreadPoolExecutor
+        os.makedirs(self.download_path, exist_ok=True)
+        results = []; session = self.session()
+        def report(res):
+            results.append(res)
+            if on_item: on_item(res)
+        def fetched(future, url, title):
+            # fetch only catches per-candidate errors; anything else (e.g. malformed thumbnail data) is still a failed item
+            try: res = future.result()
+            except Exception as e: res = {'url': url, 'title': title, 'path': None, 'error': clean_text(str(e))[:200] or "Thumbnail failed", 'thumbnail': None, 'converted': False}
+            report(res)
+        with ThreadPoolExecutor(self.workers) as pool:
+            for url, title, thumbs, error in self.items(urls):
+                if error: report({'url': url, 'title': title, 'path': None, 'error': error, 'thumbnail': None, 'converted': False}); continue
+                pool.submit(self.fetch, session, url, title, thumbs).add_done_callback(lambda f, url=url, title=title: fetched(f, url, title))
+        session.close()
+        return results
+
+    def fetch(self, session, url, title, thumbs):
+        res = {'url': url, 'title': title, 'path': None, 'error': None, 'thumbnail': None, 'converted': False}
+        if self.cancelled: res['error'] = "Cancelled"; return res
+        for thumb in best_thumbnail_order(thumbs)[:self.candidates]:
+            path = None
+            try:
+                r = session.get(thumb['url'], timeout=self.timeout, stream=True)
+                if r.status_code != 200: r.close(); continue
+                head = next(r.iter_content(64 * 1024), b"")
+                ctype = r.headers.get('Content-Type', "").split(";")[0].strip().lower()
+                is_jpeg = head.startswith(JPEG_MAGIC)
+                ext = "jpg" if is_jpeg else IMAGE_EXTS.get(ctype) or (thumb['url'].split("?")[0].rsplit(".", 1)[-1].lower() if "." in thumb['url'].rsplit("/", 1)[-1] else "img")
+                path = self.target(title, ext, res)
+                with open(path + ".part", 'wb') as f:
+                    f.write(head)
+                    for block in r.iter_content(64 * 1024): f.write(block)
+                os.replace(path + ".part", path)
+                res.update(path=path, thumbnail=thumb['url'], error=None)
+                if not is_jpeg:
+                    jpg = self.to_jpeg(path); res.update(path=jpg, converted=jpg != path)
+                self.outputs.release(res); self.outputs.add(res['path'])
+                return res
+            except Exception as e:
+                res['error'] = clean_text(str(e))[:200]
+                if path: delete_file(path + ".part")
+        self.outputs.release(res, keep=False)
+        res['error'] = res['error'] or "No thumbnail available"
+        return res
+
+    def target(self, title, ext, owner):
+        # Other formats are converted to .jpg afterwards (or kept if that fails), so both names must be free
+        base = clean_filename(title)[:150] or "thumbnail"
+        return self.outputs.claim(os.path.join(self.download_path, f"{base}.{ext}"), owner, () if ext == "jpg" else (".jpg",))
+
+    def to_jpeg(self, path):
+        # Keep the original if FFmpeg is missing or fails; a webp cover is better than none
+        import shutil
+        ffmpeg = FFMPEG_EXE if os.path.exists(FFMPEG_EXE) else shutil.which("ffmpeg")
+        target = os.path.splitext(path)[0] + ".jpg"
+        if not ffmpeg: return path
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", path, "-q:v", "2", target], check=True, timeout=60, capture_output=True,
+                           creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            delete_file(path); return target
+        except Exception: delete_file(target); return path
+
+    def cancel(self): self.cancelled = True
     def debug(self, msg): pass
     def info(self, msg): pass
     def warning(self, msg): pass
-    def error(self, msg): pass
+    def error(self, msg): self.last_error = clean_text(msg).replace("ERROR: ", "", 1)
 
-def clean_filename(s): return "".join([c for c in s if c.isalpha() or c.isdigit() or c in " .-_"]).rstrip()
+def thumbnail_entry(res):
+    return {'title': res['title'], 'url': res['url'], 'platform': detect_platform(res['url']), 'size': format_size(os.path.getsize(res['path']) if os.path.exists(res['path']) else 0), 'path': res['path'], 'date': get_timestamp()}
+
+# ================= SERVICES =================
+class Services:
+    # The download subsystems and default job options, built from settings once for the GUI and the CLI
+    def __init__(self, settings, max_concurrent=None, limit_kbps=None, journal=True):
+        self.settings = settings; self.history = None
+        self.scheduler = DownloadScheduler(max_concurrent or settings.get("max_concurrent"), settings.get("per_host_limit"), settings.get("fragment_budget"))
+        self.cache = MetadataCache(ttl=settings.get("metadata_cache_ttl"), max_bytes=settings.get("metadata_cache_mb") * 1024 * 1024)
+        self.progress = ProgressAggregator()
+        self.pp_pool = PostProcessPool(settings.get("postprocess_workers"))
+        limits = rate_limits(settings)
+        if limit_kbps is not None: limits.update(global_limit=limit_kbps * 1024, schedule=[])
+        self.rates = RateScheduler(**limits)
+        self.metrics = MetricsRecorder() if settings.get("metrics_enabled") else None
+        self.tuner = FragmentTuner(maximum=settings.get("fragment_budget")) if settings.get("adaptive_fragments") else None
+        self.disk = DiskReservations(margin=settings.get("disk_reserve_mb") * 1024 * 1024); self.outputs = OutputIndex()
+        self.journal = JobJournal() if journal else None
+        self.retry = RetryPolicy(max_attempts=settings.get("max_retries"))
+
+    def options(self, **overrides):
+        # Settings first; overrides that are None keep the setting
+        s = self.settings
+        opts = {'download_path': s.get("download_path"), 'format': s.get("format"), 'resolution': s.get("resolution"), 'proxy': s.get("proxy"), 'cookies_path': s.get("cookies_path"),
+                'embed_subs': s.get("embed_subs"), 'save_thumbnail': s.get("save_thumbnail"), 'mode': 'normal',
+                'dedup_policy': s.get("dedup_policy"), 'dedup_hash': s.get("dedup_hash"), 'profile': s.get("profile_jobs"), 'preallocate': s.get("preallocate")}
+        opts.update((k, v) for k, v in overrides.items() if v is not None)
+        return opts
+
+    def engine(self, task_id, url, options, callbacks):
+        return DownloaderEngine(task_id, url, options, callbacks, cache=self.cache, progress=self.progress, journal=self.journal, retry=self.retry, pp_pool=self.pp_pool,
+                                history=self.history, rates=self.rates, metrics=self.metrics, tuner=self.tuner, disk=self.disk, outputs=self.outputs)
+
+    def thumbnails(self, options):
+        return ThumbnailBatch(options['download_path'], workers=self.settings.get("thumbnail_workers"), proxy=options['proxy'], cookies_path=options['cookies_path'], outputs=self.outputs)
+
+# ================= CLI =================
+def read_url_lines(stream):
+    return [line.strip() for line in stream if line.strip() and not line.strip().startswith("#")]
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m onyx_backend", description=f"{APP_NAME} {VERSION} headless downloader. Prints one JSON object per line.")
+    parser.add_argument("urls", nargs="*", help="URLs to download")
+    parser.add_argument("-i", "--input", action="append", default=[], help="file with one URL per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="download folder (default: download_path from settings.json)")
+    parser.add_argument("-m", "--mode", choices=["normal", "thumbnail"], default="normal")
+    parser.add_argument("-f", "--format", choices=["Video + Audio", "Audio Only"], default="Video + Audio")
+    parser.add_argument("-r", "--resolution", choices=["Best", "4K", "1080p", "720p", "480p"], default="Best")
+    parser.add_argument("-j", "--parallel", type=int, help="concurrent downloads (default: max_concurrent from settings.json)")
+    parser.add_argument("--subs", action="store_true", help="embed subtitles")
+    parser.add_argument("--save-thumbnail", action="store_true", help="also save the thumbnail next to the video")
+    parser.add_argument("--proxy", help="proxy URL (default from settings.json)")
+    parser.add_argument("--cookies", help="cookies.txt path (default from settings.json)")
+    parser.add_argument("--limit-rate", type=int, metavar="KBPS", help="total bandwidth cap in KB/s, 0 for none (default: rate_limit_kbps from settings.json)")
+    parser.add_argument("--profile", choices=["cpu", "memory"], help=f"profile each job (cProfile or tracemalloc) into {PROFILE_DIR}")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between progress lines")
+    parser.add_argument("--no-history", action="store_true", help="do not record downloads in history")
+    parser.add_argument("--dedup", choices=["skip", "relink", "force"], help="media already in history: skip it, record it again, or download again (default: dedup_policy from settings.json)")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    for path in args.input:
+        if path == "-": urls += read_url_lines(sys.stdin)
+        else:
+            with open(path, 'r') as f: urls += read_url_lines(f)
+    if not urls and not args.input and not sys.stdin.isatty(): urls = read_url_lines(sys.stdin)
+    if not urls: parser.error("no URLs given")
+
+    settings = SettingsManager()
+    history = None if args.no_history else HistoryManager()
+    out_lock = threading.Lock()
+    def emit(event, **fields):
+        with out_lock: print(json.dumps({'event': event, **fields}), flush=True)
+
+    results = {}
+    engines = []
+    def finished(tid, res, ok):
+        if ok and history and not res.get('playlist') and res.get('duplicate') != 'skip': history.add(res)
+        results[tid] = ok; emit("finished", task=tid, ok=ok, result=res)
+    def entry(parent, url, title):
+        submit(f"{parent}.{sum(1 for e in engines if e.task_id.startswith(parent + '.')) + 1}", url, parent=parent, title=title)
+    callbacks = {'finished': finished, 'entry': entry, 'log': lambda tid, msg: emit("log", task=tid, message=msg), 'state': lambda tid, state: emit("state", task=tid, state=state)}
+
+    services = Services(settings, max_concurrent=args.parallel, limit_kbps=args.limit_rate, journal=False); services.history = history
+    scheduler, progress, rates = services.scheduler, services.progress, services.rates
+    opts = services.options(download_path=args.output or None, format=args.format, resolution=args.resolution, proxy=args.proxy, cookies_path=args.cookies,
+                            embed_subs=args.subs, save_thumbnail=args.save_thumbnail, mode=args.mode, dedup_policy=args.dedup, profile=args.profile)
+    os.makedirs(opts['download_path'], exist_ok=True)
+    if history: threading.Thread(target=history.rebuild_index, args=(opts['download_path'], opts['dedup_hash']), daemon=True).start()
+
+    if args.mode == 'thumbnail':
+        # Cover art skips the download engine: one flat extraction pass, then parallel image fetches
+        batch = services.thumbnails(opts)
+        def thumbnail(res):
+            if res['path'] and history: history.add(thumbnail_entry(res))
+            emit("thumbnail", ok=bool(res['path']), **res)
+        try: done = batch.run(urls, thumbnail)
+        except KeyboardInterrupt:
+            batch.cancel(); emit("cancelled")
+            return 130
+        ok = sum(1 for r in done if r['path'])
+        emit("summary", ok=ok, failed=len(done) - ok, converted=sum(1 for r in done if r.get('converted')))
+        return 0 if ok == len(done) else 1
+
+    def submit(tid, url, **fields):
+        engine = services.engine(tid, url, dict(opts), callbacks)
+        engines.append(engine); emit("queued", task=tid, url=url, **fields)
+        scheduler.submit(engine)
+    for i, url in enumerate(urls, 1): submit(str(i), url)
+    try:
+        while len(results) < len(engines):
+            time.sleep(args.interval)
+            allocated = rates.allocations()
+            for tid, (pct, done, total, speed, eta) in progress.snapshot().items():
+                if tid not in results: emit("progress", task=tid, percent=pct, bytes=done, total=total, speed=round(speed), eta=None if eta is None else round(eta), limit=allocated.get(tid) or None)
+    except KeyboardInterrupt:
+        for engine in engines: scheduler.cancel(engine)
+        emit("cancelled")
+        return 130
+    ok = sum(1 for v in results.values() if v)
+    emit("summary", ok=ok, failed=len(results) - ok, stats=scheduler.stats(), postprocessing=services.pp_pool.stats(), cache=services.cache.stats(), bandwidth=rates.stats(),
+         metrics=services.metrics.summary() if services.metrics else {}, fragments=services.tuner.stats() if services.tuner else {})
+    return 0 if ok == len(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
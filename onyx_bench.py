@@ -0,0 +1,310 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import http.server
+from urllib.parse import urlparse, parse_qsl
+
+import onyx_backend as core
+
+# ================= PROGRESS PIPELINE =================
+def simulate_hooks(tasks, rate, seconds, on_update):
+    # Each task fires `rate` hook callbacks per second, like yt-dlp with N fragments in flight
+    stop = time.monotonic() + seconds
+    def task(tid):
+        downloaded, total, interval = 0, 500 * 1024 * 1024, 1.0 / rate
+        while time.monotonic() < stop:
+            downloaded += 64 * 1024
+            on_update(tid, downloaded, total)
+            time.sleep(interval)
+    threads = [threading.Thread(target=task, args=(f"task-{i}",), daemon=True) for i in range(tasks)]
+    for t in threads: t.start()
+    return threads
+
+def bench_progress(tasks=20, fragments=16, seconds=3.0, hz=10):
+    rate = fragments * 20
+    results = {}
+
+    # Old path: one queued UI event per hook call, each formatted on the UI thread
+    events = queue.Queue(); handled = [0]
+    def direct(tid, done, total): events.put((tid, int(done * 100 / total), core.clean_text(f"{done / 1024:.1f}KiB/s")))
+    cpu0 = time.process_time(); t0 = time.monotonic()
+    threads = simulate_hooks(tasks, rate, seconds, direct)
+    while any(t.is_alive() for t in threads) or not events.empty():
+        try: tid, pct, spd = events.get(timeout=0.05)
+        except queue.Empty: continue
+        _ = f"Speed: {spd} {pct}"; handled[0] += 1
+    elapsed = time.monotonic() - t0
+    results['direct'] = {'ui_events': handled[0], 'ui_events_per_sec': round(handled[0] / elapsed, 1), 'cpu_sec': round(time.process_time() - cpu0, 3)}
+
+    # New path: hooks write into the aggregator, the UI pulls one snapshot per tick
+    agg = core.ProgressAggregator(); handled = [0]
+    cpu0 = time.process_time(); t0 = time.monotonic()
+    threads = simulate_hooks(tasks, rate, seconds, lambda tid, done, total: agg.update(tid, "f", done, total))
+    while any(t.is_alive() for t in threads):
+        time.sleep(1.0 / hz)
+        for tid, (pct, done, total, spd, eta) in agg.snapshot().items():
+            _ = f"Speed: {core.format_size(spd)}/s {pct} {core.format_eta(eta)}"; handled[0] += 1
+    elapsed = time.monotonic() - t0
+    results['aggregated'] = {'ui_events': handled[0], 'ui_events_per_sec': round(handled[0] / elapsed, 1), 'cpu_sec': round(time.process_time() - cpu0, 3)}
+    results['params'] = {'tasks': tasks, 'fragments': fragments, 'hook_calls_per_task_sec': rate, 'seconds': seconds, 'ui_hz': hz}
+    return results
+
+# ================= STARTUP =================
+IMPORT_PROBE = "import sys, time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t, ' '.join(m for m in {lazy!r} if m in sys.modules))"
+
+def bench_import_time(runs=5, threshold_ms=150.0):
+    # Cold import of the backend in a fresh interpreter; heavy deps must stay unloaded
+    here = os.path.dirname(os.path.abspath(__file__))
+    lazy = ('yt_dlp', 'requests', 'PyQt6')
+    times, loaded = [], ""
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module="onyx_backend", lazy=lazy)], cwd=here, capture_output=True, text=True, check=True).stdout.split(maxsplit=1)
+        times.append(float(out[0]) * 1000); loaded = out[1].strip() if len(out) > 1 else ""
+    best = min(times)
+    return {'onyx_backend_ms': round(best, 1), 'runs_ms': [round(t, 1) for t in times], 'eagerly_loaded': loaded.split(),
+            'threshold_ms': threshold_ms, 'passed': best <= threshold_ms and not loaded}
+
+# ================= LOCAL MEDIA SERVER =================
+# Everything is synthesized in memory: /media/<size>/<id>.mp4 (Range-capable), an HLS media playlist under
+# /hls/<segments>/<segment_size>/<id>/ and a DASH SegmentTemplate manifest under /dash/<segments>/<segment_size>/<id>/
+PATTERN = bytes(range(256)) * 1024
+
+def payload(start, length):
+    # Byte at offset p is p % 256, so any range can be produced without storing the file
+    while length > 0:
+        n = min(length, len(PATTERN) - 256)
+        yield PATTERN[start % 256:start % 256 + n]; start += n; length -= n
+
+HLS_PLAYLIST = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:4\n#EXT-X-MEDIA-SEQUENCE:0\n{segments}#EXT-X-ENDLIST\n"
+DASH_MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S" minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-live:2011">
+  <Period id="0" start="PT0S">
+    <AdaptationSet id="0" contentType="video" mimeType="video/mp4" segmentAlignment="true">
+      <SegmentTemplate timescale="1" duration="4" startNumber="1" initialization="init.mp4" media="seg$Number$.m4s"/>
+      <Representation id="av" bandwidth="4000000" codecs="avc1.4d401f,mp4a.40.2" width="1280" height="720"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+class MediaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0   # seconds before each response starts
+    rate = 0        # bytes/s per connection, 0 = loopback speed
+
+    def log_message(self, *args): pass
+    def do_HEAD(self): self.serve(head=True)
+    def do_GET(self): self.serve()
+
+    def serve(self, head=False):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if self.latency: time.sleep(self.latency)
+        try:
+            if parts[0] == "media": return self.send_bytes(int(parts[1]), "video/mp4", head)
+            if parts[0] in ("hls", "dash"):
+                segments, seg_size, name = int(parts[1]), int(parts[2]), parts[-1]
+                if name == "index.m3u8": return self.send_text(HLS_PLAYLIST.format(segments="".join(f"#EXTINF:4.0,\nseg{i}.ts\n" for i in range(segments))), "application/vnd.apple.mpegurl", head)
+                if name == "manifest.mpd": return self.send_text(DASH_MANIFEST.format(duration=segments * 4), "application/dash+xml", head)
+                if name == "init.mp4": return self.send_bytes(1024, "video/mp4", head)
+                if re.fullmatch(r"seg\d+\.(ts|m4s)", name): return self.send_bytes(seg_size, "video/mp2t", head)
+        except (ValueError, IndexError): pass
+        self.send_error(404)
+
+    def send_text(self, text, ctype, head):
+        body = text.encode()
+        self.send_response(200); self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(body))); self.end_headers()
+        if not head: self.wfile.write(body)
+
+    def send_bytes(self, size, ctype, head):
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if m and (m[1] or m[2]):
+            start, end = (int(m[1]), min(int(m[2] or size - 1), size - 1)) if m[1] else (max(0, size - int(m[2])), size - 1)
+            if start >= size:
+                self.send_response(416); self.send_header("Content-Range", f"bytes */{size}"); self.send_header("Content-Length", "0"); self.end_headers(); return
+            self.send_response(206); self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else: self.send_response(200)
+        self.send_header("Content-Type", ctype); self.send_header("Accept-Ranges", "bytes"); self.send_header("Content-Length", str(end - start + 1)); self.end_headers()
+        if head: return
+        t0, sent = time.monotonic(), 0
+        try:
+            for block in payload(start, end - start + 1):
+                for i in range(0, len(block), 64 * 1024):
+                    self.wfile.write(block[i:i + 64 * 1024]); sent += min(64 * 1024, len(block) - i)
+                    if self.rate:
+                        ahead = sent / self.rate - (time.monotonic() - t0)
+                        if ahead > 0: time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError): pass
+
+@contextlib.contextmanager
+def media_server(latency=0.0, rate=0):
+    handler = type("Handler", (MediaHandler,), {'latency': latency, 'rate': rate})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler); server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try: yield f"http://127.0.0.1:{server.server_port}"
+    finally: server.shutdown(); server.server_close()
+
+@contextlib.contextmanager
+def stub_extractor():
+    # yt-dlp resolves /bench/<http|hls|dash>/<id>?size=&segments=&segment_size= against the local server
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+    class OnyxBenchIE(InfoExtractor):
+        _VALID_URL = r"https?://127\.0\.0\.1:\d+/bench/(?P<kind>http|hls|dash)/(?P<id>\w+)"
+        def _real_extract(self, url):
+            kind, vid = self._match_valid_url(url).group("kind", "id")
+            base, q = url.split("/bench/")[0], dict(parse_qsl(urlparse(url).query))
+            segments, seg_size = q.get("segments", "32"), q.get("segment_size", str(512 * 1024))
+            if kind == "http":
+                size = int(q.get("size", 16 * 1024 * 1024))
+                formats = [{'url': f"{base}/media/{size}/{vid}.mp4", 'ext': 'mp4', 'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2', 'filesize': size}]
+            elif kind == "hls": formats = self._extract_m3u8_formats(f"{base}/hls/{segments}/{seg_size}/{vid}/index.m3u8", vid, "mp4", entry_protocol="m3u8_native")
+            else: formats = self._extract_mpd_formats(f"{base}/dash/{segments}/{seg_size}/{vid}/manifest.mpd", vid)
+            return {'id': vid, 'title': f"bench {kind} {vid}", 'formats': formats}
+    original = yt_dlp.YoutubeDL
+    class BenchYoutubeDL(original):
+        def __init__(self, params=None, auto_init=True):
+            super().__init__(params, auto_init=False); self.add_info_extractor(OnyxBenchIE()); self.add_default_info_extractors()
+    yt_dlp.YoutubeDL = BenchYoutubeDL
+    try: yield
+    finally: yt_dlp.YoutubeDL = original
+
+def run_jobs(urls, out_dir, fragments=1, hz=10):
+    # Runs the real scheduler/engine/aggregator pipeline; the main thread plays the UI timer
+    class CountingAggregator(core.ProgressAggregator):
+        calls = 0
+        def update(self, *args, **kwargs):
+            CountingAggregator.calls += 1; super().update(*args, **kwargs)
+    jobs = len(urls); done = {}; progress = CountingAggregator()
+    metrics = core.MetricsRecorder(os.path.join(out_dir, "metrics.jsonl"))
+    scheduler = core.DownloadScheduler(jobs, jobs, fragments * jobs); pp_pool = core.PostProcessPool()
+    callbacks = {'finished': lambda tid, res, ok: done.__setitem__(tid, ok), 'log': lambda tid, msg: None, 'state': lambda tid, state: None}
+    opts = {'download_path': out_dir, 'format': "Video + Audio", 'resolution': "Best", 'mode': 'normal', 'dedup_policy': 'force'}
+    engines = [core.DownloaderEngine(str(i), url, dict(opts), callbacks, progress=progress, retry=core.RetryPolicy(max_attempts=0), pp_pool=pp_pool, metrics=metrics) for i, url in enumerate(urls)]
+    t0 = time.monotonic(); ui_updates = 0
+    for engine in engines: scheduler.submit(engine)
+    while len(done) < jobs:
+        time.sleep(1.0 / hz); ui_updates += len(progress.snapshot())
+    elapsed = time.monotonic() - t0
+    size = sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir) if f.startswith("bench "))
+    return {'ok': sum(done.values()), 'jobs': jobs, 'wall_s': round(elapsed, 3), 'mbps': round(size / elapsed / 1024 / 1024, 2),
+            'hook_calls_per_sec': round(CountingAggregator.calls / elapsed, 1), 'ui_updates_per_sec': round(ui_updates / elapsed, 1), 'metrics': metrics.summary().get('Generic', {})}
+
+# ================= PIPELINE =================
+def bench_throughput(jobs=(1, 4), fragments=(1, 8), kinds=("http", "hls", "dash"), size=16 * 1024 * 1024, segment_size=512 * 1024, server_rate=8 * 1024 * 1024):
+    # Per-connection server cap makes the value of concurrent jobs/fragments visible on loopback
+    results = {'params': {'size': size, 'segment_size': segment_size, 'server_rate_per_conn': server_rate}}
+    with media_server(rate=server_rate) as base, stub_extractor():
+        for kind in kinds:
+            for n in jobs:
+                for frags in (fragments if kind != "http" else (1,)):
+                    urls = [f"{base}/bench/{kind}/j{n}f{frags}n{i}?size={size}&segments={size // segment_size}&segment_size={segment_size}" for i in range(n)]
+                    with tempfile.TemporaryDirectory() as out:
+                        r = run_jobs(urls, out, frags)
+                    m = r.pop('metrics')
+                    r['ttfb_p50_s'] = m.get('ttfb_s', {}).get('p50'); r['extract_p50_s'] = m.get('extract_s', {}).get('p50')
+                    results[f"{kind}_jobs{n}_frags{frags}"] = r
+    return results
+
+def bench_ttfb(runs=10, latency=0.02, size=1024 * 1024):
+    # Sequential single jobs against a server that waits `latency` before every response
+    with media_server(latency=latency) as base, stub_extractor(), tempfile.TemporaryDirectory() as out:
+        samples = []
+        for i in range(runs):
+            r = run_jobs([f"{base}/bench/http/ttfb{i}?size={size}"], out)
+            samples.append(r['metrics'])
+    ttfb = sorted(s['ttfb_s']['p50'] for s in samples if 'ttfb_s' in s); extract = sorted(s['extract_s']['p50'] for s in samples if 'extract_s' in s)
+    return {'runs': runs, 'server_latency_s': latency, 'ttfb_p50_s': core.percentile(ttfb, 50) if ttfb else None, 'ttfb_p95_s': core.percentile(ttfb, 95) if ttfb else None,
+            'extract_p50_s': core.percentile(extract, 50) if extract else None, 'extract_p95_s': core.percentile(extract, 95) if extract else None}
+
+# ================= HISTORY =================
+def best_of(fn, repeat=5):
+    # Minimum over a few runs; single sub-millisecond samples are mostly scheduler noise
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_history(sizes=(10_000, 100_000), adds=500):
+    results = {}
+    rnd = random.Random(42)
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            h = core.HistoryManager(path, None)
+            rows = [h.row({'title': f"Video {i} {rnd.random():.6f}", 'platform': rnd.choice(("YouTube", "TikTok", "Instagram", "Generic")), 'size': "10.00 MB",
+                           'path': os.path.join(tmp, f"v{i}.mp4"), 'date': core.get_timestamp(), 'url': f"https://www.youtube.com/watch?v=id{i:08d}", 'extractor': "Youtube", 'video_id': f"id{i:08d}"}) for i in range(n)]
+            t = time.perf_counter()
+            with h.lock, h.db: h.db.executemany(h.insert_sql(), rows)
+            bulk = time.perf_counter() - t
+            t = time.perf_counter()
+            for i in range(adds): h.add({'title': f"New {i}", 'platform': "YouTube", 'path': os.path.join(tmp, f"n{i}.mp4"), 'date': core.get_timestamp(), 'url': f"https://youtu.be/new{i:07d}"})
+            add = (time.perf_counter() - t) / adds
+            h.close()
+            timings = {'open_ms': best_of(lambda: core.HistoryManager(path, None).close())}
+            h = core.HistoryManager(path, None)
+            timings['first_page_ms'] = best_of(lambda: (h.count(), h.page(0, 100)))
+            timings['deep_page_ms'] = best_of(lambda: h.page(n // 2, 100))
+            timings['search_ms'] = best_of(lambda: (h.count("Video 12", "YouTube"), h.page(0, 100, "Video 12", "YouTube")))
+            timings['dedup_lookup_ms'] = best_of(lambda: [h.find_duplicates(f"https://youtu.be/id{rnd.randrange(n):08d}", "Youtube", f"id{rnd.randrange(n):08d}") for _ in range(100)]) / 100
+            h.close()
+            results[str(n)] = {'bulk_insert_ms': round(bulk * 1000, 1), 'add_ms': round(add * 1000, 3), **{k: round(v * 1000, 3) for k, v in timings.items()}}
+    return results
+
+BENCHMARKS = {
+    'progress': bench_progress,
+    'import_time': bench_import_time,
+    'throughput': bench_throughput,
+    'ttfb': bench_ttfb,
+    'history': bench_history,
+}
+
+def compare(results, baseline, tolerance):
+    # Timings (*_ms, *_s) may not grow and throughput (mbps) may not shrink by more than `tolerance`
+    regressions = []
+    def walk(new, old, path):
+        for key, value in new.items():
+            if key not in old or key == 'params': continue
+            if isinstance(value, dict) and isinstance(old[key], dict): walk(value, old[key], f"{path}{key}."); continue
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not isinstance(old[key], (int, float)) or not old[key]: continue
+            # Sub-millisecond timings jitter by more than any tolerance; ignore differences below the noise floor
+            noise = 1.0 if key.endswith("_ms") else 0.05
+            if key.endswith(("_ms", "_s")) and value > old[key] * (1 + tolerance) and value - old[key] > noise: regressions.append(f"{path}{key}: {old[key]} -> {value}")
+            elif key.endswith("mbps") and value < old[key] * (1 - tolerance): regressions.append(f"{path}{key}: {old[key]} -> {value}")
+    walk(results, baseline.get('results', baseline), "")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Onyx offline benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier --json output; exit non-zero if timings or throughput regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change before --compare reports a regression (default 0.25)")
+    args = parser.parse_args(argv)
+    results = {}
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS: parser.error(f"unknown benchmark: {name}")
+        results[name] = BENCHMARKS[name]()
+        print(json.dumps({name: results[name]}), flush=True)
+    failed = [name for name, r in results.items() if r.get('passed') is False]
+    if args.json_out:
+        with open(args.json_out, 'w') as f: json.dump({'version': core.VERSION, 'python': sys.version.split()[0], 'results': results}, f, indent=4)
+    if failed: print(f"Regression threshold exceeded: {', '.join(failed)}", file=sys.stderr)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f: regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions: print(f"Regression: {line}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+from datetime import datetime
+import onyx_backend as core
+
+class StubEngine:
+    def __init__(self, url):
+        self.url = url; self.task_id = url; self.rate = None
+    def set_rate(self, rate): self.rate = rate
+
+def test_bucket_debt_is_the_sleep_that_keeps_the_rate():
+    bucket = core.TokenBucket(rate=1000, burst=1.0); bucket.stamp = 0.0
+    assert bucket.consume(500, now=0.0) == 0.5
+    assert bucket.consume(0, now=0.5) == 0.0  # half a second paid the debt back
+    assert bucket.consume(1500, now=2.5) == 0.5  # idle time refills at most one burst
+    assert core.TokenBucket().consume(10 ** 9) == 0.0  # rate 0 is unlimited
+
+def test_water_filling_serves_small_host_caps_first():
+    rates = core.RateScheduler(global_limit=300, host_limits={'a.com': 50})
+    engines = [StubEngine(u) for u in ("https://a.com/1", "https://b.com/1", "https://b.com/2")]
+    for e in engines: rates.register(e)
+    assert [e.rate for e in engines] == [50, 125, 125]
+    rates.unregister(engines[1])
+    assert engines[2].rate == 250 and rates.stats()['allocated'] == 300
+
+def test_host_cap_is_shared_without_a_global_limit():
+    rates = core.RateScheduler(host_limits={'a.com': 100})
+    engines = [StubEngine(u) for u in ("https://a.com/1", "https://a.com/2", "https://b.com/1")]
+    for e in engines: rates.register(e)
+    assert [e.rate for e in engines] == [50, 50, 0]
+
+def test_schedule_window_overrides_global_limit_across_midnight():
+    rates = core.RateScheduler(global_limit=1000, schedule=[{'start': "22:00", 'end': "06:00", 'limit': 10}, {'start': "bad"}])
+    assert rates.limit_now(datetime(2024, 1, 1, 23, 30)) == 10 and rates.limit_now(datetime(2024, 1, 1, 5, 59)) == 10
+    assert rates.limit_now(datetime(2024, 1, 1, 12, 0)) == 1000
+
+def test_rate_limits_skips_invalid_settings():
+    limits = core.rate_limits({"rate_limit_kbps": "2MB", "host_rate_limits_kbps": {"a.com": "fast", "b.com": 8, "c.com": None},
+                               "rate_schedule": [{"start": "01:00", "end": "02:00", "limit_kbps": "x"}, {"start": "03:00", "end": "04:00", "limit_kbps": 4}, "junk"]})
+    assert limits['global_limit'] == 0 and limits['host_limits'] == {"b.com": 8192}
+    assert [w['limit'] for w in limits['schedule']] == [4096]
+    assert core.rate_limits({"host_rate_limits_kbps": ["a.com"]})['host_limits'] == {}
@@ -0,0 +1,19 @@
+import onyx_backend as core
+
+def info(vid, pad=0):
+    return {'id': vid, 'title': vid, 'description': "x" * pad, 'formats': [{'format_id': '0', 'url': f"https://cdn.example.com/{vid}.mp4"}]}
+
+def test_entries_round_trip_as_copies(tmp_path):
+    cache = core.MetadataCache(str(tmp_path / "cache.db"))
+    cache.put("https://example.com/watch?v=a", {}, info("a"))
+    first = cache.get("https://example.com/watch?v=a&utm_source=x", {})
+    first['title'] = "changed"
+    assert cache.get("https://example.com/watch?v=a", {})['title'] == "a"
+    assert cache.get("https://example.com/watch?v=b", {}) is None
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    cache = core.MetadataCache(str(tmp_path / "cache.db"), max_bytes=25_000)
+    for vid in "abc": cache.put(f"https://example.com/{vid}", {}, info(vid, 10_000)); cache.get("https://example.com/a", {})
+    assert cache.get("https://example.com/a", {}) and cache.get("https://example.com/c", {})
+    assert cache.get("https://example.com/b", {}) is None
+    assert cache.stats()['bytes'] <= 25_000
@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+import onyx_backend as core
+
+def test_output_index_numbers_taken_names(tmp_path):
+    (tmp_path / "Clip.mp4").write_bytes(b"x")
+    index, a, b = core.OutputIndex(), object(), object()
+    first = index.claim(str(tmp_path / "Clip.mp4"), a)
+    assert os.path.basename(first) == "Clip (2).mp4"
+    assert index.claim(str(tmp_path / "Clip.mp4"), a) == first  # a retry keeps its name
+    assert os.path.basename(index.claim(str(tmp_path / "Clip.mp4"), b)) == "Clip (3).mp4"
+    index.release(a, keep=False)
+    assert index.claim(str(tmp_path / "Clip.mp4"), object()) == first
+
+def test_thumbnail_names_go_through_the_index(tmp_path):
+    (tmp_path / "Cover.jpg").write_bytes(b"x"); (tmp_path / "Poster.png").write_bytes(b"x")
+    batch = core.ThumbnailBatch(str(tmp_path))
+    names = [os.path.basename(batch.target(title, ext, {})) for title, ext in (("Cover", "jpg"), ("Cover", "webp"), ("Poster", "png"))]
+    assert names == ["Cover (2).jpg", "Cover (3).webp", "Poster (2).png"]
+
+def test_thumbnail_fetch_errors_are_reported_as_failed_items(tmp_path, monkeypatch):
+    batch = core.ThumbnailBatch(str(tmp_path))
+    monkeypatch.setattr(batch, "items", lambda urls: iter([("https://a.com/1", "Broken", ["not a dict"], None), ("https://a.com/2", "Empty", [], None)]))
+    results = {res['title']: res for res in batch.run(["https://a.com/list"])}
+    assert set(results) == {"Broken", "Empty"}
+    assert results["Broken"]['path'] is None and results["Broken"]['error'] and results["Empty"]['error'] == "No thumbnail available"
+
+def test_reservations_count_what_other_jobs_still_need(tmp_path, monkeypatch):
+    import shutil
+    monkeypatch.setattr(shutil, "disk_usage", lambda p: shutil._ntuple_diskusage(1000, 0, 1000))
+    disk, a, b = core.DiskReservations(margin=100), object(), object()
+    assert disk.reserve(a, str(tmp_path), 600)[0]
+    assert not disk.reserve(b, str(tmp_path), 600)[0]
+    disk.written(a, 500)  # already on disk, so only 100 is still held back
+    assert disk.reserve(b, str(tmp_path), 600)[0]
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="fallocate")
+def test_preallocate_keeps_file_size(tmp_path):
+    path = tmp_path / "part"; path.write_bytes(b"abc")
+    assert core.preallocate(str(path), 1024 * 1024)
+    assert path.stat().st_size == 3 and path.stat().st_blocks * 512 >= 1024 * 1024
@@ -0,0 +1,79 @@
+import os
+import pytest
+import onyx_backend as core
+import onyx_bench as bench
+
+@pytest.fixture
+def server():
+    with bench.media_server() as base, bench.stub_extractor(): yield base
+
+@pytest.fixture
+def extract_calls(server, monkeypatch):
+    # Every _real_extract of the stub extractor, i.e. every time a page would be resolved over the network
+    import yt_dlp
+    ie = type(yt_dlp.YoutubeDL({'quiet': True}).get_info_extractor('OnyxBench'))
+    calls, real = [], ie._real_extract
+    monkeypatch.setattr(ie, '_real_extract', lambda self, url: calls.append(url) or real(self, url))
+    return calls
+
+def run_job(url, out_dir, history=None, **options):
+    done = {}
+    def finished(tid, res, ok):
+        if ok and history and res.get('duplicate') != 'skip': history.add(res)
+        done.update(ok=ok, res=res)
+    callbacks = {'finished': finished, 'log': lambda tid, msg: None}
+    opts = {'download_path': str(out_dir), 'format': "Video + Audio", 'resolution': "Best", 'mode': 'normal', 'dedup_policy': 'force'}
+    opts.update(options)
+    core.DownloaderEngine("1", url, opts, callbacks, retry=core.RetryPolicy(max_attempts=0), history=history).run()
+    return done
+
+@pytest.mark.parametrize("kind", ["http", "hls", "dash"])
+def test_one_extraction_per_job(server, extract_calls, tmp_path, kind):
+    done = run_job(f"{server}/bench/{kind}/clip?size=65536&segments=4&segment_size=16384", tmp_path)
+    assert done['ok'] and len(extract_calls) == 1
+    # The path comes from yt-dlp's hooks, not from a rebuilt file name
+    assert os.path.isfile(done['res']['path']) and os.path.dirname(done['res']['path']) == str(tmp_path)
+
+def test_each_job_extracts_once(server, extract_calls, tmp_path):
+    for i in range(3): assert run_job(f"{server}/bench/http/clip{i}?size=32768", tmp_path)['ok']
+    assert len(extract_calls) == 3 and len(set(extract_calls)) == 3
+
+def test_generic_files_with_the_same_name_are_not_duplicates(server, tmp_path):
+    history = core.HistoryManager(str(tmp_path / "history.db"), None)
+    first = run_job(f"{server}/media/3000/clip.mp4", tmp_path / "a", history, dedup_policy='skip')
+    assert first['ok'] and first['res']['extractor'] == 'Generic'
+    second = run_job(f"{server}/media/1000/clip.mp4", tmp_path / "b", history, dedup_policy='skip')
+    assert second['ok'] and not second['res'].get('duplicate') and os.path.getsize(second['res']['path']) == 1000
+    again = run_job(f"{server}/media/1000/clip.mp4", tmp_path / "c", history, dedup_policy='skip')
+    assert again['res'].get('duplicate') == 'skip'
+    history.close()
+
+def test_every_resolution_choice_selects_its_own_format(server, tmp_path, monkeypatch):
+    chosen = {}
+    monkeypatch.setattr(core.DownloaderEngine, "preflight", lambda self, ydl, info: chosen.__setitem__(self.options['resolution'], ydl.params.get('format')))
+    for res in ("Best", "4K", "1080p", "720p", "480p"): assert run_job(f"{server}/bench/http/r{res}?size=1024", tmp_path, resolution=res)['ok']
+    assert len(set(chosen.values())) == 5 and "height=480" in chosen["480p"]
+
+def test_services_options_fill_from_settings():
+    settings = core.SettingsManager.__new__(core.SettingsManager)  # no settings.json
+    settings.config = {"download_path": "/d", "format": "Video + Audio", "resolution": "Best", "proxy": "http://p", "dedup_policy": "skip"}
+    services = core.Services.__new__(core.Services); services.settings = settings
+    opts = services.options(resolution="480p", proxy="", dedup_policy=None)
+    assert opts['download_path'] == "/d" and opts['resolution'] == "480p" and opts['proxy'] == "" and opts['dedup_policy'] == "skip"
+
+def test_retry_after_postprocessing_takes_a_slot_again(server, tmp_path, monkeypatch):
+    held, failed = [], []
+    real_run, real_enter = core.DownloaderEngine._run, core.DownloaderEngine.enter_postprocessing
+    monkeypatch.setattr(core.DownloaderEngine, "_run", lambda self: held.append(self.scheduler.holds(self)) or real_run(self))
+    def enter(self, step):
+        real_enter(self, step)
+        if not failed: failed.append(step); raise Exception("postprocessing failed")
+    monkeypatch.setattr(core.DownloaderEngine, "enter_postprocessing", enter)
+    done = {}
+    callbacks = {'finished': lambda tid, res, ok: done.update(ok=ok), 'log': lambda tid, msg: None}
+    opts = {'download_path': str(tmp_path), 'format': "Video + Audio", 'resolution': "Best", 'mode': 'normal', 'dedup_policy': 'force'}
+    engine = core.DownloaderEngine("1", f"{server}/bench/http/pp?size=4096", opts, callbacks, retry=core.RetryPolicy(max_attempts=1, base=0.01))
+    scheduler = core.DownloadScheduler(max_workers=1)
+    scheduler.submit(engine); engine.join(30)
+    assert done['ok'] and failed and held == [True, True]
+    assert scheduler.stats()['running'] == 0
@@ -0,0 +1,12 @@
+import json
+import os
+import onyx_backend as core
+
+def test_migration_runs_once_when_rename_fails(tmp_path, monkeypatch):
+    legacy = tmp_path / "history.json"
+    legacy.write_text(json.dumps([{'title': "b", 'url': "https://example.com/b"}, {'title': "a", 'url': "https://example.com/a"}]))
+    monkeypatch.setattr(os, "replace", lambda *a: (_ for _ in ()).throw(PermissionError()))
+    for _ in range(3):
+        history = core.HistoryManager(str(tmp_path / "history.db"), str(legacy))
+        assert [r['title'] for r in history.page()] == ["b", "a"]
+        history.close()
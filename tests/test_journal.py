@@ -0,0 +1,50 @@
+import time
+import pytest
+import onyx_backend as core
+
+@pytest.fixture
+def journal(tmp_path):
+    j = core.JobJournal(str(tmp_path / "jobs.db"))
+    yield j
+    j.close()
+
+def states(journal):
+    return {r['id']: r['state'] for r in journal.db.execute("SELECT id, state FROM jobs")}
+
+def test_transition_is_compare_and_set(journal):
+    journal.add("a", "https://example.com/a", {'format': "Audio Only"})
+    assert not journal.transition("a", ('running',), 'done', error="nope")
+    assert states(journal) == {'a': 'queued'} and journal.db.execute("SELECT error FROM jobs").fetchone()[0] == ""
+    assert journal.transition("a", ('queued', 'retrying'), 'running')
+    assert journal.transition("a", ('running',), 'retrying', attempts=1, error="timeout")
+    assert not journal.transition("missing", ('queued',), 'running')
+    assert dict(journal.db.execute("SELECT state, attempts, error FROM jobs").fetchone()) == {'state': 'retrying', 'attempts': 1, 'error': "timeout"}
+
+def test_pending_requeues_interrupted_jobs(journal):
+    for job_id, state in (("q", 'queued'), ("r", 'running'), ("t", 'retrying'), ("d", 'done'), ("f", 'failed')):
+        journal.add(job_id, f"https://example.com/{job_id}", {}, priority=1 if job_id == "t" else 0)
+        if state != 'queued': journal.transition(job_id, ('queued',), state)
+    journal.update("r", partials=["/tmp/r.mp4.part"])
+    jobs = journal.pending()
+    assert [j['id'] for j in jobs] == ["t", "q", "r"]
+    assert all(j['state'] == 'queued' for j in jobs) and jobs[2]['partials'] == ["/tmp/r.mp4.part"]
+    assert states(journal) == {'q': 'queued', 'r': 'queued', 't': 'queued', 'd': 'done', 'f': 'failed'}
+    assert journal.is_active("https://example.com/r") and not journal.is_active("https://example.com/d")
+
+def test_prune_drops_only_old_finished_jobs(journal):
+    for job_id in ("old-done", "new-done", "old-queued"): journal.add(job_id, f"https://example.com/{job_id}", {})
+    journal.transition("old-done", ('queued',), 'done'); journal.transition("new-done", ('queued',), 'done')
+    with journal.db: journal.db.execute("UPDATE jobs SET updated = ? WHERE id LIKE 'old-%'", (time.time() - 8 * 86400,))
+    journal.prune()
+    assert set(states(journal)) == {"new-done", "old-queued"}
+
+@pytest.mark.parametrize("error", ["ERROR: Private video. Sign in if you've been granted access", "Video unavailable", "Unsupported URL: https://x",
+                                   "[Errno 28] No space left on device", "Not enough disk space: needs ~2 GB, 1 GB free", "Cancelled"])
+def test_permanent_errors_are_not_retried(error):
+    assert not core.RetryPolicy(max_attempts=3).should_retry(0, Exception(error))
+
+def test_transient_errors_retry_up_to_max_attempts():
+    policy = core.RetryPolicy(max_attempts=2)
+    error = Exception("HTTP Error 503: Service Unavailable")
+    assert [policy.should_retry(n, error) for n in range(3)] == [True, True, False]
+    assert all(0 < policy.delay(n) <= policy.cap * 1.25 for n in range(10))
@@ -0,0 +1,82 @@
+import hashlib
+import http.server
+import io
+import os
+import re
+import threading
+import zipfile
+import pytest
+import onyx_backend as core
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args): pass
+
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        if data is None: return self.send_error(404)
+        start, end = 0, len(data) - 1
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if m:
+            start, end = int(m[1]), min(int(m[2] or end), end)
+            self.send_response(206); self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else: self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1)); self.send_header("ETag", '"v1"'); self.end_headers()
+        body = data[start:end + 1]
+        # drop: cut the next response after this many bytes, like a flaky link
+        if self.server.drop and len(body) > self.server.drop:
+            body = body[:self.server.drop]; self.server.drop = 0; self.close_connection = True
+        self.wfile.write(body); self.server.sent += len(body)
+
+@pytest.fixture
+def server():
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler); srv.daemon_threads = True
+    srv.files, srv.sent, srv.drop = {}, 0, 0
+    srv.base = f"http://127.0.0.1:{srv.server_port}"
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown(); srv.server_close()
+
+def blob(n, seed=b"onyx"):
+    out, block = bytearray(), seed
+    while len(out) < n: block = hashlib.sha256(block).digest(); out += block
+    return bytes(out[:n])
+
+def test_fetches_only_the_needed_zip_entry(server, tmp_path, monkeypatch):
+    exe = blob(300_000)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        z.writestr("ffmpeg/doc/manual.bin", blob(2_000_000, b"doc"))
+        z.writestr("ffmpeg/bin/ffmpeg.exe", exe)
+        z.writestr("ffmpeg/bin/ffprobe.exe", blob(2_000_000, b"probe"))
+    server.files["/ffmpeg.zip"] = buf.getvalue()
+    monkeypatch.setattr(core, "FFMPEG_URL", server.base + "/ffmpeg.zip")
+    monkeypatch.setattr(core, "FFMPEG_EXE", str(tmp_path / "ffmpeg.exe"))
+    monkeypatch.setattr(core, "BASE_DIR", str(tmp_path))
+    ok, msg = core.DependencyManager().download_ffmpeg(lambda p: None, lambda s: None)
+    assert ok, msg
+    assert (tmp_path / "ffmpeg.exe").read_bytes() == exe
+    assert server.sent < len(exe) + 100_000
+    assert sorted(os.listdir(tmp_path)) == ["ffmpeg.exe"]
+
+def test_resumes_from_state_file_after_dropped_connection(server, tmp_path):
+    data = blob(1_000_000); server.files["/file.bin"] = data; server.drop = 400_000
+    path = str(tmp_path / "file.bin")
+    first = core.RangedDownloader(server.base + "/file.bin", path, connections=1, chunk_size=16 * 1024, retries=0)
+    with pytest.raises(Exception): first.download()
+    assert os.path.exists(path + ".state.json")
+    fetched = server.sent; server.sent = 0
+    second = core.RangedDownloader(server.base + "/file.bin", path, connections=1, sha256=hashlib.sha256(data).hexdigest())
+    second.download()
+    with open(path, "rb") as f: assert f.read() == data
+    # Only the part that never arrived is requested again (plus the 1-byte probe)
+    assert server.sent <= len(data) - fetched + 1 + 16 * 1024
+    assert not os.path.exists(path + ".state.json")
+
+def test_rejects_sha256_mismatch(server, tmp_path):
+    server.files["/file.bin"] = blob(200_000)
+    path = str(tmp_path / "file.bin")
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        core.RangedDownloader(server.base + "/file.bin", path, sha256="0" * 64).download()
+    assert not os.path.exists(path) and not os.path.exists(path + ".state.json")
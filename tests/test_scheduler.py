@@ -0,0 +1,68 @@
+import onyx_backend as core
+
+class StubEngine:
+    # Just what DownloadScheduler touches; start() records dispatch order instead of running a thread
+    started = []
+
+    def __init__(self, url):
+        self.url = url; self.scheduler = None; self.state = None; self.cancelled = False; self.journal = None
+        self.task_id = url; self.callbacks = {'finished': lambda tid, res, ok: None}; self.fragments = None
+
+    def start(self): StubEngine.started.append(self.url); self.refresh_fragments()
+    def refresh_fragments(self): self.fragments = self.scheduler.fragments_for(self)
+
+def submit(scheduler, urls, priority=0):
+    engines = [StubEngine(u) for u in urls]
+    for e in engines: scheduler.submit(e, priority)
+    return engines
+
+def test_higher_priority_runs_first_then_fifo():
+    StubEngine.started = []
+    scheduler = core.DownloadScheduler(max_workers=1, per_host=5)
+    first = submit(scheduler, ["https://a.com/1"])[0]
+    submit(scheduler, ["https://a.com/2", "https://a.com/3"]); submit(scheduler, ["https://a.com/thumb"], priority=1)
+    for _ in range(3): scheduler.release(next(e for e in scheduler.running))
+    assert StubEngine.started == ["https://a.com/1", "https://a.com/thumb", "https://a.com/2", "https://a.com/3"]
+    assert first.state == 'running'
+
+def test_max_workers_bound():
+    scheduler = core.DownloadScheduler(max_workers=3, per_host=10)
+    submit(scheduler, [f"https://a{i}.com/v" for i in range(7)])
+    assert scheduler.stats()['running'] == 3 and scheduler.stats()['queued'] == 4
+
+def test_per_host_cap_counts_share_links_as_one_site():
+    scheduler = core.DownloadScheduler(max_workers=10, per_host=2)
+    urls = ["https://youtu.be/a", "https://m.youtube.com/watch?v=b", "https://music.youtube.com/watch?v=c", "https://www.youtube.com/watch?v=d", "https://other.org/x"]
+    submit(scheduler, urls)
+    st = scheduler.stats()
+    assert st['running'] == 3 and st['queued'] == 2 and st['hosts'] == {'YouTube': 2, 'other.org': 1}
+
+def test_fragment_shares_follow_the_running_set():
+    scheduler = core.DownloadScheduler(max_workers=4, per_host=4, fragment_budget=32)
+    engines = submit(scheduler, [f"https://a{i}.com/v" for i in range(4)])
+    assert [e.fragments for e in engines] == [8, 8, 8, 8]
+    scheduler.release(engines[0])
+    assert [e.fragments for e in engines[1:]] == [10, 10, 10]
+    assert sum(e.fragments for e in engines[1:]) <= 32
+
+def test_retry_after_postprocessing_waits_for_a_slot():
+    StubEngine.started = []
+    scheduler = core.DownloadScheduler(max_workers=1, per_host=5)
+    first, second = submit(scheduler, ["https://a.com/1", "https://b.com/2"])
+    scheduler.release(first)  # post-processing gave the slot back
+    ready = scheduler.reacquire(first)
+    assert not ready.is_set() and scheduler.holds(second) and not scheduler.holds(first)
+    scheduler.release(second)
+    assert ready.is_set() and scheduler.holds(first)
+    assert StubEngine.started == ["https://a.com/1", "https://b.com/2"]
+
+def test_cancelling_a_waiting_retry_leaves_the_report_to_its_thread():
+    scheduler = core.DownloadScheduler(max_workers=1, per_host=5)
+    first, second = submit(scheduler, ["https://a.com/1", "https://b.com/2"])
+    scheduler.release(first); scheduler.release(second)
+    blocker = submit(scheduler, ["https://c.com/3"])[0]
+    reports = []; first.callbacks = {'finished': lambda tid, res, ok: reports.append(ok)}
+    scheduler.reacquire(first); scheduler.cancel(first)
+    assert first.cancelled and reports == [] and scheduler.stats()['queued'] == 0
+    scheduler.release(blocker)
+    assert not first.resume.is_set()
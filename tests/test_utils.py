@@ -0,0 +1,31 @@
+import onyx_backend as core
+
+def test_normalize_url_drops_only_tracking_params():
+    n = core.normalize_url
+    assert n("https://youtu.be/abc?si=x&utm_source=share") == n("https://m.youtube.com/watch?feature=share&v=abc")
+    # Real parameters that merely start like a tracking one still tell URLs apart
+    for key in ("sig", "size", "single", "signature", "sid", "features"):
+        assert n(f"https://cdn.example.com/v?{key}=1") != n(f"https://cdn.example.com/v?{key}=2")
+
+def test_url_media_id_only_for_known_platforms():
+    assert core.url_media_id("https://youtu.be/dQw4w9WgXcQ?si=x") == ("Youtube", "dQw4w9WgXcQ")
+    assert core.url_media_id("https://cdn.example.com/media/clip.mp4") == ("Generic", "")
+
+def test_throttle_detection_ignores_non_throttling_errors():
+    throttled = ["[download] Got error: HTTP Error 429: Too Many Requests. Retrying fragment 3 (1/10)...",
+                 "[download] Got error: HTTP Error 503: Service Unavailable. Retrying fragment 12 (2/10)...",
+                 "[youtube] abc: The current session has been rate-limited by YouTube for up to an hour",
+                 "ERROR: unable to download video data: HTTP Error 429: Too Many Requests"]
+    other = ["ERROR: [youtube] abc: HTTP Error 403: Forbidden",
+             "[download] Got error: HTTP Error 403: Forbidden. Retrying fragment 3 (1/10)..."]
+    assert all(core.THROTTLE_RE.search(m) for m in throttled)
+    assert not any(core.THROTTLE_RE.search(m) for m in other)
+
+def test_a_run_of_fragment_errors_backs_off(tmp_path):
+    tuner = core.FragmentTuner(path=str(tmp_path / "tuning.json"), initial=8)
+    engine = core.DownloaderEngine("1", "https://cdn.example.com/v.m3u8", {}, {}, tuner=tuner); engine.record = core.JobMetrics(engine)
+    msg = "[download] Got error: HTTP Error 403: Forbidden. Retrying fragment 3 (1/10)..."
+    for _ in range(core.FRAGMENT_ERROR_RUN - 1): engine.note(msg)
+    assert not engine.throttled and tuner.suggest(engine.host) == 8
+    engine.note(msg)
+    assert engine.throttled and tuner.suggest(engine.host) == 4